@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""Local stand-in for the subset of the Jira REST API used by jirastats.py.
+
+Serves /rest/api/2/search, /rest/api/2/issue, /rest/api/2/project and the greenhopper
+rapidviews/sprintquery/sprintreport endpoints from synthetic fixtures, with optional
+per-request latency. Run it directly to point a manual jirastats.py run at it.
+"""
+
+import argparse
+import datetime
+import json
+import random
+import re
+import socket
+import sys
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STORYPOINTS_FIELD = 'customfield_10008'
+ISSUE_TYPES = ['Story', 'Bug', 'Task']
+STATUSES = ['To Do', 'READY FOR CODING', 'CODING', 'READY FOR TESTING', 'TESTING', 'Done']
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%S.000+0000'
+SPRINT_DATE_FORMAT = '%d/%b/%y %H:%M %p'
+
+
+def jira_timestamp(dt):
+    return dt.strftime(DATE_FORMAT)
+
+
+def generate_fixtures(projects=3, issues=200, sprints=10, weeks=26, seed=1):
+    rnd = random.Random(seed)
+    start = datetime.datetime(2018, 1, 1)
+    end = start + datetime.timedelta(weeks=weeks)
+    fixtures = {'issues': [], 'projects': [], 'views': [], 'sprints': {}, 'reports': {}, 'archive': None}
+    view_id = 100
+    sprint_id = 1000
+    for p in range(projects):
+        key = 'P' + chr(ord('A') + p % 26) + str(p)
+        name = 'Project ' + key
+        fixtures['projects'].append({'key': key, 'name': name, 'id': str(10000 + p)})
+        config = {'start_date': str(start.date()), 'end_date': str(end.date()), 'title': name,
+                  'datasets': [{'name': 'Stories', 'issue_types': 'Story', 'start_date': str(start.date()),
+                                'end_date': str(end.date()), 'milestones': [{'name': 'M1', 'date': str((start + datetime.timedelta(weeks=weeks // 2)).date()), 'color': 'red'}]},
+                               {'name': 'All', 'issue_types': 'Story, Bug, Task', 'start_date': str(start.date()),
+                                'end_date': str(end.date()), 'milestones': []}]}
+        if p % 2 == 1:
+            config['estimate_type'] = 'man_days'
+        fixtures['issues'].append({'key': key + '-1', 'project': key, 'summary': 'ReportsConfig', 'issuetype': 'Task',
+                                   'description': '# burnup config\n' + json.dumps(config), 'created': start,
+                                   'updated': start, 'resolutiondate': None, 'status': 'To Do', 'histories': [],
+                                   'sp': None, 'est': None})
+        for i in range(issues):
+            created = start + datetime.timedelta(minutes=rnd.randrange(weeks * 7 * 24 * 60))
+            histories = []
+            status = STATUSES[0]
+            t = created
+            resolutiondate = None
+            for next_status in STATUSES[1:]:
+                if rnd.random() < 0.25:
+                    break
+                t = t + datetime.timedelta(minutes=rnd.randrange(60, 5 * 24 * 60))
+                histories.append({'id': str(len(histories)), 'author': {'displayName': 'user' + str(rnd.randrange(5))},
+                                  'created': jira_timestamp(t),
+                                  'items': [{'field': 'status', 'fromString': status, 'toString': next_status}]})
+                status = next_status
+            if status == 'Done':
+                resolutiondate = t
+            fixtures['issues'].append({'key': key + '-' + str(i + 2), 'project': key, 'summary': 'Issue ' + str(i),
+                                       'issuetype': rnd.choice(ISSUE_TYPES), 'description': None, 'created': created,
+                                       'updated': t, 'resolutiondate': resolutiondate, 'status': status,
+                                       'histories': histories, 'sp': rnd.choice([None, 1, 2, 3, 5, 8]),
+                                       'est': rnd.choice([None, 3600 * 4, 3600 * 8, 3600 * 16])})
+        fixtures['views'].append({'id': view_id, 'name': name})
+        fixtures['sprints'][view_id] = []
+        for s in range(sprints):
+            sprint_start = start + datetime.timedelta(weeks=2 * s)
+            state = 'CLOSED' if s < sprints - 2 else ('ACTIVE' if s == sprints - 2 else 'FUTURE')
+            fixtures['sprints'][view_id].append({'id': sprint_id, 'name': key + ' Sprint ' + str(s), 'state': state})
+            completed = rnd.randrange(10, 40)
+            fixtures['reports'][(view_id, sprint_id)] = {
+                'contents': {'allIssuesEstimateSum': {'value': completed + rnd.randrange(0, 10)},
+                             'completedIssuesEstimateSum': {'value': completed},
+                             'completedIssues': [{'typeName': rnd.choice(ISSUE_TYPES)} for _ in range(5)],
+                             'issuesNotCompletedInCurrentSprint': [{'typeName': rnd.choice(ISSUE_TYPES)} for _ in range(2)]},
+                'sprint': {'id': sprint_id, 'startDate': sprint_start.strftime(SPRINT_DATE_FORMAT),
+                           'endDate': (sprint_start + datetime.timedelta(weeks=2)).strftime(SPRINT_DATE_FORMAT)}}
+            sprint_id += 1
+        view_id += 1
+    return fixtures
+
+
+def get_endpoint(path):
+    path = re.sub(r'/[A-Z][A-Z0-9]*-\d+(?=/|$)', '/{issue}', path)
+    path = re.sub(r'^/rest/api/2/project/[^/]+$', '/rest/api/2/project/{project}', path)
+    return re.sub(r'/\d+$', '/{id}', path)
+
+
+class JqlFilter:
+    CLAUSE_RES = [
+        (re.compile(r'^project\s*=\s*"?([\w-]+)"?$', re.I), lambda m: lambda i: i['project'].upper() == m.group(1).upper()),
+        (re.compile(r'^project\s+in\s*\((.*)\)$', re.I), lambda m: JqlFilter.in_list('project', m.group(1))),
+        (re.compile(r'^issuetype\s+in\s*\((.*)\)$', re.I), lambda m: JqlFilter.in_list('issuetype', m.group(1))),
+        (re.compile(r'^status\s+in\s*\((.*)\)$', re.I), lambda m: JqlFilter.in_list('status', m.group(1))),
+        (re.compile(r'^created(?:Date)?\s*<=\s*"([^"]+)"$', re.I), lambda m: JqlFilter.date_cmp('created', m.group(1), False)),
+        (re.compile(r'^resolutiondate\s*<=\s*"([^"]+)"$', re.I), lambda m: JqlFilter.date_cmp('resolutiondate', m.group(1), False)),
+        (re.compile(r'^updated\s*>=\s*"([^"]+)"$', re.I), lambda m: JqlFilter.date_cmp('updated', m.group(1), True)),
+        (re.compile(r'^resolution\s*!=\s*Unresolved$', re.I), lambda m: lambda i: i['resolutiondate'] is not None),
+        (re.compile(r'^summary\s*~\s*"([^"]+)"$', re.I), lambda m: lambda i: m.group(1).lower() in i['summary'].lower()),
+        (re.compile(r'^key\s+in\s*\((.*)\)$', re.I), lambda m: JqlFilter.in_list('key', m.group(1))),
+    ]
+
+    def __init__(self, jql):
+        jql = re.sub(r'\s+ORDER BY .*$', '', jql, flags=re.I)
+        self.predicates = []
+        for clause in re.split(r'\s+AND\s+', jql.strip(), flags=re.I):
+            for clause_re, builder in self.CLAUSE_RES:
+                m = clause_re.match(clause.strip())
+                if m:
+                    self.predicates.append(builder(m))
+                    break
+            else:
+                raise ValueError('unsupported JQL clause: ' + clause)
+
+    @staticmethod
+    def in_list(field, values):
+        names = set(v.strip().strip('"').lower() for v in values.split(','))
+        return lambda i: i[field].lower() in names
+
+    @staticmethod
+    def date_cmp(field, value, greater):
+        if len(value) > 10:
+            bound = datetime.datetime.strptime(value, '%Y-%m-%d %H:%M')
+        else:
+            bound = datetime.datetime.strptime(value, '%Y-%m-%d')
+        if greater:
+            return lambda i: i[field] is not None and i[field] >= bound
+        return lambda i: i[field] is not None and i[field] <= bound
+
+    def __call__(self, issue):
+        return all(p(issue) for p in self.predicates)
+
+
+class FakeJira:
+    def __init__(self, fixtures, latency=0.0, changelog_limit=100):
+        self.fixtures = fixtures
+        self.changelog_limit = changelog_limit
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.bytes_sent = 0
+        self.requests_by_path = {}
+        self.base_url = ''
+
+    def issue_json(self, issue, fields, expand, in_search=False):
+        all_fields = {'summary': issue['summary'], 'description': issue['description'],
+                      'issuetype': {'name': issue['issuetype']}, 'project': {'key': issue['project']},
+                      'status': {'name': issue['status']}, 'created': jira_timestamp(issue['created']),
+                      'updated': jira_timestamp(issue['updated']),
+                      'resolutiondate': jira_timestamp(issue['resolutiondate']) if issue['resolutiondate'] else None,
+                      'resolution': {'name': 'Done'} if issue['resolutiondate'] else None,
+                      STORYPOINTS_FIELD: issue['sp'], 'timeoriginalestimate': issue['est'], 'fixVersions': []}
+        if issue['summary'] == 'ReportsConfig' and self.fixtures['archive'] is not None:
+            all_fields['attachment'] = [{'id': '1', 'filename': 'archive.json', 'size': len(self.fixtures['archive']),
+                                         'content': self.base_url + '/attachment/archive.json'}]
+        else:
+            all_fields['attachment'] = []
+        if '*all' in fields or not fields:
+            selected = all_fields
+        else:
+            selected = {f: all_fields[f] for f in fields if f in all_fields}
+        result = {'key': issue['key'], 'id': issue['key'], 'fields': selected}
+        if 'changelog' in expand:
+            histories = issue['histories'][:self.changelog_limit] if in_search else issue['histories']
+            result['changelog'] = {'startAt': 0, 'maxResults': len(histories), 'total': len(issue['histories']),
+                                   'histories': histories}
+        return result
+
+    def split_list(self, values):
+        result = []
+        for v in values:
+            result.extend(x for x in v.split(',') if x)
+        return result
+
+    def search(self, query):
+        jql = query.get('jql', [''])[0]
+        start_at = int(query.get('startAt', ['0'])[0])
+        max_results = min(int(query.get('maxResults', ['50'])[0]), 1000)
+        fields = self.split_list(query.get('fields', []))
+        expand = self.split_list(query.get('expand', []))
+        jql_filter = JqlFilter(jql)
+        matched = [i for i in self.fixtures['issues'] if jql_filter(i)]
+        page = matched[start_at:start_at + max_results]
+        return 200, {'startAt': start_at, 'maxResults': max_results, 'total': len(matched),
+                     'issues': [self.issue_json(i, fields, expand, True) for i in page]}
+
+    def route(self, path, query):
+        if path == '/rest/api/2/search':
+            return self.search(query)
+        m = re.match(r'^/rest/api/2/issue/([\w-]+)/changelog$', path)
+        if m:
+            for issue in self.fixtures['issues']:
+                if issue['key'] == m.group(1):
+                    start_at = int(query.get('startAt', ['0'])[0])
+                    max_results = int(query.get('maxResults', ['100'])[0])
+                    values = issue['histories'][start_at:start_at + max_results]
+                    return 200, {'startAt': start_at, 'maxResults': max_results, 'total': len(issue['histories']),
+                                 'isLast': start_at + len(values) >= len(issue['histories']), 'values': values}
+            return 404, {'errorMessages': ['Issue does not exist']}
+        m = re.match(r'^/rest/api/2/issue/([\w-]+)$', path)
+        if m:
+            for issue in self.fixtures['issues']:
+                if issue['key'] == m.group(1):
+                    return 200, self.issue_json(issue, self.split_list(query.get('fields', [])), self.split_list(query.get('expand', [])))
+            return 404, {'errorMessages': ['Issue does not exist']}
+        if path == '/rest/api/2/project':
+            return 200, [{'key': p['key'], 'name': p['name'], 'id': p['id']} for p in self.fixtures['projects']]
+        m = re.match(r'^/rest/api/2/project/([\w-]+)$', path)
+        if m:
+            for project in self.fixtures['projects']:
+                if project['key'] == m.group(1):
+                    return 200, project
+            return 404, {'errorMessages': ['No project']}
+        if path == '/rest/greenhopper/1.0/rapidviews/list':
+            return 200, {'views': self.fixtures['views']}
+        m = re.match(r'^/rest/greenhopper/1.0/sprintquery/(\d+)$', path)
+        if m:
+            return 200, {'sprints': self.fixtures['sprints'].get(int(m.group(1)), []), 'rapidViewId': int(m.group(1))}
+        if path == '/rest/greenhopper/1.0/rapid/charts/sprintreport':
+            key = (int(query['rapidViewId'][0]), int(query['sprintId'][0]))
+            if key in self.fixtures['reports']:
+                return 200, self.fixtures['reports'][key]
+            return 404, {}
+        if path == '/attachment/archive.json' and self.fixtures['archive'] is not None:
+            return 200, json.loads(self.fixtures['archive'])
+        return 404, {'errorMessages': ['not found: ' + path]}
+
+    def make_handler(self):
+        jira = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def do_GET(self):
+                parsed = urllib.parse.urlparse(self.path)
+                query = urllib.parse.parse_qs(parsed.query)
+                if jira.latency > 0:
+                    time.sleep(jira.latency)
+                try:
+                    status, body = jira.route(parsed.path, query)
+                except ValueError as e:
+                    status, body = 400, {'errorMessages': [str(e)]}
+                data = json.dumps(body).encode('utf-8')
+                with jira.lock:
+                    jira.request_count += 1
+                    jira.bytes_sent += len(data)
+                    endpoint = get_endpoint(parsed.path)
+                    jira.requests_by_path[endpoint] = jira.requests_by_path.get(endpoint, 0) + 1
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def stats(self):
+        with self.lock:
+            return {'requests': self.request_count, 'bytes': self.bytes_sent, 'by_endpoint': dict(self.requests_by_path)}
+
+    def reset_stats(self):
+        with self.lock:
+            self.request_count = 0
+            self.bytes_sent = 0
+            self.requests_by_path = {}
+
+
+def serve(jira, port=0):
+    server = ThreadingHTTPServer(('127.0.0.1', port), jira.make_handler())
+    server.daemon_threads = True
+    jira.base_url = 'http://127.0.0.1:' + str(server.server_address[1])
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve synthetic Jira data for jirastats.py.')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--projects', type=int, default=3)
+    parser.add_argument('--issues', type=int, default=200)
+    parser.add_argument('--sprints', type=int, default=10)
+    parser.add_argument('--weeks', type=int, default=26)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--changelog-limit', type=int, default=100, help='histories returned per issue in search results')
+    args = parser.parse_args()
+    jira = FakeJira(generate_fixtures(args.projects, args.issues, args.sprints, args.weeks), args.latency, args.changelog_limit)
+    server = serve(jira, args.port)
+    sys.stderr.write('serving on ' + jira.base_url + '\n')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
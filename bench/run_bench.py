@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""Offline benchmark of jirastats.py against the local fake Jira.
+
+Every engine runs main() end to end in its own process against the same fixtures and
+reports wall time, request count, bytes transferred and peak RSS. The data.json of
+every run is compared with the first engine's output (generated_at and fetched_at
+excluded), so a performance change that alters the output fails the benchmark.
+
+An engine is given as "name [ENV=value ...] [--flag ...]"; "{tmp}" in a value expands
+to a scratch directory kept for all runs of that engine, e.g.
+
+    python3 bench/run_bench.py --projects 5 --issues 2000 --latency 0.02 \\
+        --engine "jql" --engine "single_pass JS_BURNDOWN_ENGINE=single_pass --async"
+"""
+
+import argparse
+import datetime
+import itertools
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import fake_jira
+
+JIRASTATS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'jirastats.py')
+DEFAULT_ENGINES = [
+    'jql',
+    'single_pass JS_BURNDOWN_ENGINE=single_pass',
+    'async JS_BURNDOWN_ENGINE=single_pass --async',
+    'mirror JS_MIRROR_DB={tmp}/mirror.db JS_SPRINT_CACHE_DB={tmp}/sprints.db',
+]
+
+
+def parse_engine(spec):
+    tokens = spec.split()
+    env = {}
+    args = []
+    for token in tokens[1:]:
+        if '=' in token and not token.startswith('--'):
+            key, value = token.split('=', 1)
+            env[key] = value
+        else:
+            args.append(token)
+    return tokens[0], env, args
+
+
+def expand_dataset(ds):
+    # mirrors DataLoader.expandProject in js/app.js
+    if not ds.pop('compact', False):
+        return
+    if 'dates_start' in ds:
+        start = datetime.date.fromisoformat(ds.pop('dates_start'))
+        step = ds.pop('dates_step')
+        ds['dates'] = [str(start + datetime.timedelta(days=i * step)) for i in range(ds.pop('dates_count'))]
+    ds['total_estimates'] = list(itertools.accumulate(ds['total_estimates']))
+    ds['burned_estimates'] = list(itertools.accumulate(ds['burned_estimates']))
+    ds['remaining_estimates'] = [t - b for t, b in zip(ds['total_estimates'], ds['burned_estimates'])]
+    if 'url_templates' in ds:
+        ds['urls'] = {name: [template.replace('{date}', day, 1) for day in ds['dates']] for name, template in ds.pop('url_templates').items()}
+
+
+def load_output(path):
+    with open(path) as f:
+        data = json.load(f)
+    if data.get('sharded'):
+        base = os.path.dirname(path)
+        projects = []
+        for entry in data['projects']:
+            with open(os.path.join(base, entry['url'])) as f:
+                projects.append(json.load(f))
+        data['projects'] = projects
+        del data['sharded']
+    for project in data['projects']:
+        project.pop('fetched_at', None)
+        for ds in project['datasets']:
+            expand_dataset(ds)
+    data.pop('generated_at', None)
+    return data
+
+
+def run_once(jira, env, args, output):
+    jira.reset_stats()
+    run_env = dict(os.environ, JS_BASE_URL=jira.base_url, JS_OUTPUT_JSON_FILE=output, JS_USERNAME='bench', JS_PASSWORD='bench')
+    run_env.update(env)
+    with tempfile.TemporaryFile() as stderr:
+        start = time.time()
+        proc = subprocess.Popen([sys.executable, JIRASTATS] + args, env=run_env, stdout=subprocess.DEVNULL, stderr=stderr)
+        _, status, rusage = os.wait4(proc.pid, 0)
+        wall_time = time.time() - start
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        if proc.returncode != 0:
+            stderr.seek(0)
+            sys.stderr.write(stderr.read().decode('utf-8', 'replace'))
+    # ru_maxrss is in kilobytes on Linux
+    result = {'wall_time': wall_time, 'peak_rss_mb': rusage.ru_maxrss / 1024.0, 'exit_code': proc.returncode}
+    result.update(jira.stats())
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark jirastats.py engines against a local fake Jira.')
+    parser.add_argument('--projects', type=int, default=3)
+    parser.add_argument('--issues', type=int, default=500, help='issues per project')
+    parser.add_argument('--sprints', type=int, default=20, help='sprints per project')
+    parser.add_argument('--weeks', type=int, default=52, help='length of every dataset')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--changelog-limit', type=int, default=100, help='histories returned per issue in search results')
+    parser.add_argument('--runs', type=int, default=1, help='runs per engine; later runs see warm caches')
+    parser.add_argument('--engine', action='append', help='engine spec, may be repeated (default: ' + ', '.join(DEFAULT_ENGINES) + ')')
+    parser.add_argument('--json', metavar='FILE', help='also write the results as JSON')
+    args = parser.parse_args()
+
+    fixtures = fake_jira.generate_fixtures(args.projects, args.issues, args.sprints, args.weeks)
+    jira = fake_jira.FakeJira(fixtures, args.latency, args.changelog_limit)
+    server = fake_jira.serve(jira)
+    results = []
+    reference = None
+    identical = True
+    try:
+        for spec in args.engine or DEFAULT_ENGINES:
+            name, env, engine_args = parse_engine(spec)
+            tmp = tempfile.mkdtemp(prefix='jirastats-bench-')
+            try:
+                env = {k: v.replace('{tmp}', tmp) for k, v in env.items()}
+                for run in range(args.runs):
+                    output = os.path.join(tmp, 'data.json')
+                    result = run_once(jira, env, engine_args, output)
+                    result.update({'engine': name, 'run': run + 1})
+                    if result['exit_code'] == 0:
+                        data = load_output(output)
+                        if reference is None:
+                            reference = data
+                        result['identical'] = data == reference
+                    else:
+                        result['identical'] = False
+                    identical = identical and result['identical']
+                    results.append(result)
+                    print('%-14s run %d: %7.2fs %7d requests %10.1f KiB %8.1f MiB rss  %s' % (
+                        name, run + 1, result['wall_time'], result['requests'], result['bytes'] / 1024.0, result['peak_rss_mb'],
+                        'identical' if result['identical'] else 'DIFFERENT'))
+            finally:
+                shutil.rmtree(tmp, ignore_errors=True)
+    finally:
+        server.shutdown()
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    sys.exit(0 if identical else 1)
+
+
+if __name__ == '__main__':
+    main()
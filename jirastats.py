@@ -1,12 +1,36 @@
 #!/usr/bin/env python3
 
+import argparse
+import asyncio
+import contextlib
+import cProfile
+import re
 import urllib
 import requests
 import json
 import os
 import datetime
+import email.utils
+import gzip
+import hashlib
+import itertools
+import math
+import mimetypes
+import random
+import sqlite3
 import sys
-from threading import Thread, Lock
+import tempfile
+import time
+import traceback
+import zlib
+from concurrent.futures import ThreadPoolExecutor, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from requests.adapters import HTTPAdapter
+from threading import Thread, Lock, BoundedSemaphore, local
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 JS_USERNAME = os.getenv('JS_USERNAME')
 JS_PASSWORD = os.getenv('JS_PASSWORD')
@@ -14,39 +38,435 @@ JS_BASE_URL = os.getenv('JS_BASE_URL')
 JS_STORYPOINTS_FIELD = os.getenv('JS_STORYPOINTS_FIELD', 'customfield_10008')
 JS_OUTPUT_JSON_FILE = os.getenv('JS_OUTPUT_JSON_FILE')
 JS_ARCHIVE_ISSUE_KEY = os.getenv('JS_ARCHIVE_ISSUE_KEY')
+JS_OUTPUT_SHARDED = os.getenv('JS_OUTPUT_SHARDED', '0') == '1'
+JS_OUTPUT_COMPACT = os.getenv('JS_OUTPUT_COMPACT', '0') == '1'
+JS_ARCHIVE_CACHE_FILE = os.getenv('JS_ARCHIVE_CACHE_FILE')
+JS_ARCHIVE_FILE = './archive.json'
+JS_METRICS_FILE = os.getenv('JS_METRICS_FILE')
+JS_METRICS_PROM_FILE = os.getenv('JS_METRICS_PROM_FILE')
+JS_PROFILE_DIR = os.getenv('JS_PROFILE_DIR')
+JS_DAEMON_HOST = os.getenv('JS_DAEMON_HOST', '')
+JS_DAEMON_PORT = int(os.getenv('JS_DAEMON_PORT', '8000'))
+JS_DAEMON_ROOT = os.getenv('JS_DAEMON_ROOT', os.path.dirname(os.path.abspath(__file__)))
+JS_DAEMON_INTERVAL_MINUTES = int(os.getenv('JS_DAEMON_INTERVAL_MINUTES', '60'))
+JS_DAEMON_TICK_SECONDS = int(os.getenv('JS_DAEMON_TICK_SECONDS', '60'))
+JS_DAEMON_EXTENSIONS = ['.html', '.js', '.css', '.map', '.json']
 JS_TIMEESTIMATE_FIELD = 'timeoriginalestimate'
+JS_CREATED_FIELD = 'created'
+JS_RESOLUTION_FIELD = 'resolution'
+JS_RESOLUTIONDATE_FIELD = 'resolutiondate'
+JS_ENGINE_JQL = 'jql'
+JS_ENGINE_SINGLE_PASS = 'single_pass'
+JS_ENGINE_PLANNED = 'planned'
+JS_BURNDOWN_ENGINE = os.getenv('JS_BURNDOWN_ENGINE', JS_ENGINE_JQL).strip().lower()
+JS_ISSUETYPE_FIELD = 'issuetype'
+JS_STATUS_FIELD = 'status'
+JS_UPDATED_FIELD = 'updated'
+JS_PROJECT_FIELD = 'project'
+JS_PLANNER_BATCH_SIZE = int(os.getenv('JS_PLANNER_BATCH_SIZE', '10'))
+JS_MIRROR_DB = os.getenv('JS_MIRROR_DB')
+JS_MIRROR_OVERLAP_MINUTES = int(os.getenv('JS_MIRROR_OVERLAP_MINUTES', '10'))
+JS_MIRROR_FULL_SYNC_DAYS = int(os.getenv('JS_MIRROR_FULL_SYNC_DAYS', '7'))
+JS_SPRINT_CACHE_DB = os.getenv('JS_SPRINT_CACHE_DB')
+JS_SPRINT_CACHE_SIZE = int(os.getenv('JS_SPRINT_CACHE_SIZE', '10000'))
 JS_AUTH = (JS_USERNAME, JS_PASSWORD)
 JS_HEADERS = {'Content-Type': 'application/json', 'Accept': 'application/json'}
-JS_MAX_RESULTS = 999
+JS_PAGE_SIZE = int(os.getenv('JS_PAGE_SIZE', '100'))
+JS_MAX_CONCURRENCY = int(os.getenv('JS_MAX_CONCURRENCY', '8'))
+JS_MAX_PROJECTS = int(os.getenv('JS_MAX_PROJECTS', '4'))
+JS_MAX_RETRIES = int(os.getenv('JS_MAX_RETRIES', '5'))
+JS_RETRY_BACKOFF = float(os.getenv('JS_RETRY_BACKOFF', '0.5'))
+JS_MAX_RETRY_DELAY = float(os.getenv('JS_MAX_RETRY_DELAY', '60'))
+JS_REQUEST_TIMEOUT = float(os.getenv('JS_REQUEST_TIMEOUT', '60'))
+JS_RUN_DEADLINE_SECONDS = float(os.getenv('JS_RUN_DEADLINE_SECONDS', '0')) or None
+JS_REQUEST_BUDGET = int(os.getenv('JS_REQUEST_BUDGET', '0')) or None
+JS_RETRY_STATUSES = [429, 500, 502, 503, 504]
+JS_THROTTLE_STATUSES = [429, 503]
 JS_DATE_SEPARATOR = '-'
 JS_CONFIG_ISSUE_NAME = 'ReportsConfig'
 JS_CONFIG_FIELD = 'description'
 JS_EXTIMATE_SP = 'story_points'
 JS_ESTIMATE_MD = 'man_days'
 JS_DATE_FORMAT_HISTORY = '%Y-%m-%dT%H:%M:%S'
+JS_DAY_START = 'T00:00:00'
+JS_DATE_FORMAT_JQL = '%Y-%m-%d %H:%M'
 JS_DATE_FORMAT_SPRINT = '%d/%b/%y %H:%M %p'
 JS_MINIMUM_DATASETS = 1
+JS_GRANULARITY_DAY = 'day'
+JS_GRANULARITY_WEEK = 'week'
+JS_GRANULARITY_SPRINT = 'sprint'
+JS_FORECAST_SIMULATIONS = int(os.getenv('JS_FORECAST_SIMULATIONS', '20000'))
+# numpy is optional; the pure Python simulation used without it is much slower per run, so it runs fewer of them
+JS_FORECAST_FALLBACK_SIMULATIONS = int(os.getenv('JS_FORECAST_FALLBACK_SIMULATIONS', '2000'))
+JS_FORECAST_MAX_SPRINTS = int(os.getenv('JS_FORECAST_MAX_SPRINTS', '260'))
+JS_FORECAST_SPRINT_DAYS = 14
+JS_FORECAST_PERCENTILES = [50, 85, 95]
+JS_TIMES_IN_STATUSES = ['ART CREATION', 'ASSETS', 'READY FOR CODING', 'CODING', 'READY FOR TESTING', 'TESTING', 'TESTING BLOCKED']
 JS_lock = Lock()
+JS_profile_lock = Lock()
+JS_in_flight = BoundedSemaphore(JS_MAX_CONCURRENCY)
+JS_session = requests.Session()
+JS_session.auth = JS_AUTH
+JS_session.headers.update(JS_HEADERS)
+JS_session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=JS_MAX_CONCURRENCY))
+JS_session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=JS_MAX_CONCURRENCY))
 
 
 def log(log_item):
+    project = JS_metrics.get_context()[0]
+    prefix = '[' + project + '] ' if project is not None else ''
     with JS_lock:
-        sys.stderr.write(datetime.datetime.now().isoformat(sep='_')[:19] + ': ' + str(log_item) + '\n')
+        sys.stderr.write(datetime.datetime.now().isoformat(sep='_')[:19] + ': ' + prefix + str(log_item) + '\n')
         sys.stderr.flush()
 
 
+def log_fetcher_exception(fetcher, e):
+    log(fetcher.project_key + ' failed: ' + ''.join(traceback.format_exception(type(e), e, e.__traceback__)).rstrip())
+
+
+def get_endpoint_name(url):
+    path = urllib.parse.urlsplit(url).path
+    path = re.sub(r'/[A-Z][A-Z0-9_]*-\d+(?=/|$)', '/{issue}', path)
+    path = re.sub(r'/rest/api/2/project/[^/]+$', '/rest/api/2/project/{project}', path)
+    path = re.sub(r'/secure/attachment/.*$', '/secure/attachment/{attachment}', path)
+    return re.sub(r'/\d+$', '/{id}', path)
+
+
+class RunMetrics:
+    # aggregates request and phase timings per project; the current project and phase live in a thread-local context
+    def __init__(self):
+        self.lock = Lock()
+        self.context = local()
+        self.requests = {}
+        self.phases = {}
+        self.start_run()
+
+    def start_run(self):
+        # the counters keep adding up across the runs of a daemon, only the run duration restarts
+        self.started = time.time()
+
+    def get_context(self):
+        return (getattr(self.context, 'project', None), getattr(self.context, 'phase', None))
+
+    def set_context(self, context):
+        self.context.project, self.context.phase = context
+
+    @contextlib.contextmanager
+    def phase(self, name, project=None):
+        previous = self.get_context()
+        self.set_context((project if project is not None else previous[0], name))
+        start = time.time()
+        try:
+            yield
+        finally:
+            elapsed = time.time() - start
+            with self.lock:
+                entry = self.phases.setdefault((self.context.project, name), {'count': 0, 'seconds': 0.0})
+                entry['count'] += 1
+                entry['seconds'] += elapsed
+            self.set_context(previous)
+
+    def add_request(self, url, status, seconds, size, retries):
+        project, phase = self.get_context()
+        key = (project, phase, get_endpoint_name(url), str(status))
+        with self.lock:
+            entry = self.requests.setdefault(key, {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'bytes': 0, 'retries': 0})
+            entry['count'] += 1
+            entry['seconds'] += seconds
+            entry['max_seconds'] = max(entry['max_seconds'], seconds)
+            entry['bytes'] += size
+            entry['retries'] += retries
+
+    def to_json(self):
+        with self.lock:
+            requests_list = [dict(zip(['project', 'phase', 'endpoint', 'status'], k), **v) for k, v in self.requests.items()]
+            phases = [dict(zip(['project', 'phase'], k), **v) for k, v in self.phases.items()]
+        return {'generated_at': datetime.datetime.now().isoformat(sep=' ')[:19], 'run_seconds': time.time() - self.started,
+                'requests': requests_list, 'phases': phases}
+
+    def to_prometheus(self):
+        def labels(entry, names):
+            return '{' + ','.join([n + '="' + str(entry[n] if entry[n] is not None else '').replace('\\', '\\\\').replace('"', '\\"') + '"' for n in names]) + '}'
+        metrics = self.to_json()
+        request_labels = ['project', 'phase', 'endpoint', 'status']
+        lines = []
+        for name, field, metric_type, help_text in [('jirastats_requests_total', 'count', 'counter', 'Jira requests made'),
+                                                    ('jirastats_request_seconds_total', 'seconds', 'counter', 'Time spent in Jira requests, retries included'),
+                                                    ('jirastats_request_max_seconds', 'max_seconds', 'gauge', 'Slowest Jira request'),
+                                                    ('jirastats_response_bytes_total', 'bytes', 'counter', 'Jira response body bytes'),
+                                                    ('jirastats_request_retries_total', 'retries', 'counter', 'Jira request retries')]:
+            lines += ['# HELP ' + name + ' ' + help_text, '# TYPE ' + name + ' ' + metric_type]
+            lines += [name + labels(r, request_labels) + ' ' + str(r[field]) for r in metrics['requests']]
+        lines += ['# HELP jirastats_phase_seconds_total Time spent per project and phase', '# TYPE jirastats_phase_seconds_total counter']
+        lines += ['jirastats_phase_seconds_total' + labels(p, ['project', 'phase']) + ' ' + str(p['seconds']) for p in metrics['phases']]
+        lines += ['# HELP jirastats_run_seconds Duration of the last run', '# TYPE jirastats_run_seconds gauge',
+                  'jirastats_run_seconds ' + str(metrics['run_seconds']),
+                  '# HELP jirastats_last_run_timestamp_seconds End of the last run', '# TYPE jirastats_last_run_timestamp_seconds gauge',
+                  'jirastats_last_run_timestamp_seconds ' + str(time.time())]
+        return '\n'.join(lines) + '\n'
+
+    def write(self):
+        try:
+            if JS_METRICS_FILE is not None:
+                write_file_atomic(JS_METRICS_FILE, json.dumps(self.to_json(), indent=1))
+            if JS_METRICS_PROM_FILE is not None:
+                write_file_atomic(JS_METRICS_PROM_FILE, self.to_prometheus())
+        except OSError as e:
+            log(e)
+
+
+JS_metrics = RunMetrics()
+
+
+class RunLimitExceeded(Exception):
+    pass
+
+
+class RunLimits:
+    # every request attempt is checked against the run deadline and the request budget before it is sent, its timeout and
+    # backoff sleep end at the deadline
+    def __init__(self, seconds, budget):
+        self.seconds = seconds
+        self.budget = budget
+        self.lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.deadline = time.monotonic() + self.seconds if self.seconds is not None else None
+            self.used = 0
+
+    def suspend(self):
+        # only counts requests from now on, e.g. for --plan whose count searches would otherwise spend the budget
+        with self.lock:
+            self.seconds = None
+            self.budget = None
+            self.deadline = None
+
+    def is_limited(self):
+        return self.deadline is not None or self.budget is not None
+
+    def get_remaining_seconds(self):
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def get_deadline_error(self):
+        return RunLimitExceeded('run deadline of ' + str(self.seconds) + 's reached')
+
+    def get_timeout(self, timeout):
+        # a request in flight must not outlive the deadline either
+        remaining = self.get_remaining_seconds()
+        if remaining is None:
+            return timeout
+        if remaining <= 0:
+            raise self.get_deadline_error()
+        return min(timeout, remaining)
+
+    def sleep(self, delay):
+        remaining = self.get_remaining_seconds()
+        if remaining is not None and delay >= remaining:
+            raise self.get_deadline_error()
+        time.sleep(delay)
+
+    def take_request(self):
+        with self.lock:
+            if self.deadline is not None and time.monotonic() >= self.deadline:
+                raise self.get_deadline_error()
+            if self.budget is not None and self.used >= self.budget:
+                raise RunLimitExceeded('request budget of ' + str(self.budget) + ' spent')
+            self.used += 1
+
+
+JS_limits = RunLimits(JS_RUN_DEADLINE_SECONDS, JS_REQUEST_BUDGET)
+
+
+def get_retry_delay(resp, attempt):
+    delay = JS_RETRY_BACKOFF * (2 ** attempt)
+    if resp is not None and resp.status_code in JS_THROTTLE_STATUSES and 'Retry-After' in resp.headers:
+        retry_after = resp.headers['Retry-After'].strip()
+        if retry_after.isdigit():
+            delay = float(retry_after)
+        else:
+            try:
+                retry_at = email.utils.parsedate_to_datetime(retry_after)
+                delay = retry_at.timestamp() - time.time()
+            except (TypeError, ValueError):
+                pass
+    return min(max(delay, 0.0), JS_MAX_RETRY_DELAY)
+
+
+def jira_request(method, url, retry_statuses, retry_errors, **kwargs):
+    # the semaphore bounds in-flight requests across all fetchers; backoff sleeps happen outside of it. A connection error or timeout
+    # may come after the server acted on the request, so only idempotent methods retry them
+    attempt = 0
+    start = time.time()
+    while True:
+        resp = None
+        JS_limits.take_request()
+        if not JS_in_flight.acquire(timeout=JS_limits.get_remaining_seconds()):
+            raise JS_limits.get_deadline_error()
+        try:
+            resp = JS_session.request(method, url, timeout=JS_limits.get_timeout(JS_REQUEST_TIMEOUT), **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if not retry_errors or attempt >= JS_MAX_RETRIES:
+                JS_metrics.add_request(url, 'error', time.time() - start, 0, attempt)
+                raise
+            log(e)
+        else:
+            if resp.status_code not in retry_statuses or attempt >= JS_MAX_RETRIES:
+                JS_metrics.add_request(url, resp.status_code, time.time() - start, len(resp.content), attempt)
+                return resp
+            log(str(resp.status_code) + ' ' + url + ', retrying')
+        finally:
+            JS_in_flight.release()
+        JS_limits.sleep(get_retry_delay(resp, attempt))
+        attempt += 1
+
+
 def jira_post(url, data):
-    return requests.post(url, headers=JS_HEADERS, auth=JS_AUTH, data=data)
+    return jira_request('POST', url, JS_THROTTLE_STATUSES, False, data=data)
 
 
 def jira_get(url, params=None):
-    return requests.get(url, headers=JS_HEADERS, auth=JS_AUTH, params=params)
+    return jira_request('GET', url, JS_RETRY_STATUSES, True, params=params)
+
+
+class JiraResponseError(Exception):
+    def __init__(self, status_code):
+        super().__init__(status_code)
+        self.status_code = status_code
+
+
+def jira_search(jql, fields=[JS_STORYPOINTS_FIELD, JS_TIMEESTIMATE_FIELD], expand='', page_size=JS_PAGE_SIZE):
+    # walks startAt pages and parses one page at a time, so callers consuming the generator keep at most one page in memory
+    start_at = 0
+    while True:
+        search_params = {'jql': jql, 'startAt': start_at, 'maxResults': page_size, 'fields': ','.join(fields), 'expand': expand}
+        resp = jira_get(JS_BASE_URL + '/rest/api/2/search', search_params)
+        if resp.status_code != 200:
+            raise JiraResponseError(resp.status_code)
+        page = resp.json()
+        issues = page['issues'] if 'issues' in page.keys() else []
+        total = page['total'] if 'total' in page.keys() else 0
+        del page
+        start_at += len(issues)
+        for issue in issues:
+            yield issue
+        if len(issues) == 0 or start_at >= total:
+            break
+
+
+def write_file_atomic(path, data):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '.')
+    try:
+        with os.fdopen(fd, 'wb' if isinstance(data, bytes) else 'w') as f:
+            f.write(data)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def write_json_output(path, obj):
+    if not JS_OUTPUT_COMPACT:
+        write_file_atomic(path, json.dumps(obj))
+        return
+    data = json.dumps(obj, separators=(',', ':'))
+    write_file_atomic(path, data)
+    write_file_atomic(path + '.gz', gzip.compress(data.encode('utf-8'), 9))
+
+
+def get_delta_encoded(series):
+    return [series[i] - series[i - 1] if i > 0 else series[i] for i in range(len(series))]
+
+
+def get_date_step(dates):
+    steps = set([(get_date_from_str(dates[i]) - get_date_from_str(dates[i - 1])).days for i in range(1, len(dates))])
+    if len(steps) == 0:
+        return 1
+    if len(steps) == 1:
+        return steps.pop()
+    return None
+
+
+def get_url_template(urls, dates):
+    # every point link differs from the first one only in its date, which quote() leaves untouched
+    if len(urls) == 0 or len(urls) != len(dates):
+        return None
+    template = urls[0].replace(dates[0], '{date}', 1)
+    if [template.replace('{date}', day, 1) for day in dates] != urls:
+        return None
+    return template
+
+
+def get_compact_dataset(ds):
+    # dates become start + step, point links become templates and the series are delta encoded; remaining = total - burned
+    if 'dates' not in ds.keys() or 'total_estimates' not in ds.keys() or 'burned_estimates' not in ds.keys():
+        return ds
+    compact = dict(ds)
+    compact['compact'] = True
+    dates = compact.pop('dates')
+    step = get_date_step(dates) if len(dates) > 0 else None
+    if step is None:
+        compact['dates'] = dates
+    else:
+        compact['dates_start'] = dates[0]
+        compact['dates_step'] = step
+        compact['dates_count'] = len(dates)
+    if 'urls' in compact.keys():
+        templates = {name: get_url_template(urls, dates) for name, urls in compact['urls'].items()}
+        if None not in templates.values():
+            del compact['urls']
+            compact['url_templates'] = templates
+    compact['total_estimates'] = get_delta_encoded(compact['total_estimates'])
+    compact['burned_estimates'] = get_delta_encoded(compact['burned_estimates'])
+    compact.pop('remaining_estimates', None)
+    return compact
+
+
+def get_expanded_dataset(ds):
+    if not ds.get('compact', False):
+        return ds
+    expanded = dict(ds)
+    del expanded['compact']
+    if 'dates_start' in expanded.keys():
+        start = get_date_from_str(expanded.pop('dates_start'))
+        step = expanded.pop('dates_step')
+        expanded['dates'] = [str(start + datetime.timedelta(days=i * step)) for i in range(expanded.pop('dates_count'))]
+    expanded['total_estimates'] = list(itertools.accumulate(expanded['total_estimates']))
+    expanded['burned_estimates'] = list(itertools.accumulate(expanded['burned_estimates']))
+    expanded['remaining_estimates'] = [t - b for t, b in zip(expanded['total_estimates'], expanded['burned_estimates'])]
+    if 'url_templates' in expanded.keys():
+        expanded['urls'] = {name: [template.replace('{date}', day, 1) for day in expanded['dates']] for name, template in expanded.pop('url_templates').items()}
+    return expanded
+
+
+def get_compact_project(stats):
+    compact = dict(stats)
+    compact['datasets'] = [get_compact_dataset(ds) for ds in stats['datasets']]
+    return compact
+
+
+def load_json_file(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def jira_search_total(jql):
+    resp = jira_get(JS_BASE_URL + '/rest/api/2/search', {'jql': jql, 'maxResults': 0, 'fields': 'key'})
+    if resp.status_code != 200:
+        raise JiraResponseError(resp.status_code)
+    return resp.json().get('total', 0)
 
 
-def jira_search(jql, max_results=50, fields=[JS_STORYPOINTS_FIELD, JS_TIMEESTIMATE_FIELD], expand=''):
-    search_params = {'jql': jql, 'maxResults': max_results, 'fields': fields, 'expand': expand}
-    resp = jira_get(JS_BASE_URL + '/rest/api/2/search', search_params)
-    return resp
+def get_search_pages(jql):
+    return max(1, math.ceil(jira_search_total(jql) / float(JS_PAGE_SIZE)))
 
 
 def get_date_from_str(date_str):
@@ -54,20 +474,100 @@ def get_date_from_str(date_str):
     return datetime.date(*date)
 
 
-def get_days_for_estimates(start_date, end_date):
+def get_step_days(granularity):
+    # None for anything but day, week, sprint (weekly until the sprint starts are known) or a positive number of days
+    granularity = str(granularity).strip().lower()
+    if granularity == JS_GRANULARITY_DAY:
+        return 1
+    if granularity in [JS_GRANULARITY_WEEK, JS_GRANULARITY_SPRINT]:
+        return 7
+    if granularity.isdigit() and int(granularity) > 0:
+        return int(granularity)
+    return None
+
+
+def get_days_for_estimates(start_date, end_date, granularity=JS_GRANULARITY_WEEK, sprint_starts=None):
     d = get_date_from_str(start_date)
     end_d = get_date_from_str(end_date)
+    if str(granularity).strip().lower() == JS_GRANULARITY_SPRINT and sprint_starts:
+        return [str(d)] + sorted(set([str(s) for s in sprint_starts if d < s <= end_d]))
+    step_days = get_step_days(granularity)
+    if step_days is None:
+        log('unknown granularity ' + str(granularity) + ', using ' + JS_GRANULARITY_WEEK)
+        step_days = 7
+    step = datetime.timedelta(days=step_days)
     days = []
     while d <= end_d:
         days.append(str(d))
-        d += datetime.timedelta(weeks=1)
+        d += step
     return days
 
 
+def simulate_sprints_needed(velocities, remaining, runs, seed):
+    # every run draws past sprint velocities with replacement until the remaining scope is burned
+    if numpy is not None:
+        rng = numpy.random.default_rng(seed)
+        velocities = numpy.array(velocities, dtype=numpy.int64)
+        burned = numpy.zeros(runs, dtype=numpy.int64)
+        sprints = numpy.full(runs, JS_FORECAST_MAX_SPRINTS, dtype=numpy.int64)
+        pending = numpy.arange(runs)
+        for sprint in range(1, JS_FORECAST_MAX_SPRINTS + 1):
+            burned[pending] += rng.choice(velocities, len(pending))
+            done = burned[pending] >= remaining
+            sprints[pending[done]] = sprint
+            pending = pending[~done]
+            if len(pending) == 0:
+                break
+        return numpy.sort(sprints).tolist()
+    rng = random.Random(seed)
+    sprints = []
+    for _ in range(runs):
+        burned = 0
+        sprint = 0
+        while burned < remaining and sprint < JS_FORECAST_MAX_SPRINTS:
+            burned += rng.choice(velocities)
+            sprint += 1
+        sprints.append(sprint)
+    sprints.sort()
+    return sprints
+
+
+def get_sprint_days(sprint_starts):
+    starts = sorted(set(sprint_starts or []))
+    lengths = sorted([(starts[i] - starts[i - 1]).days for i in range(1, len(starts))])
+    if len(lengths) == 0 or lengths[len(lengths) // 2] < 1:
+        return JS_FORECAST_SPRINT_DAYS
+    return lengths[len(lengths) // 2]
+
+
+def get_completion_forecast(velocities, remaining, sprint_days, seed):
+    if len(velocities) == 0 or max(velocities) <= 0:
+        return None
+    today = datetime.date.today()
+    if remaining <= 0:
+        sprints = [0]
+    else:
+        runs = JS_FORECAST_SIMULATIONS if numpy is not None else JS_FORECAST_FALLBACK_SIMULATIONS
+        sprints = simulate_sprints_needed(velocities, remaining, runs, seed)
+    forecast = {'sprint_days': sprint_days, 'simulations': len(sprints)}
+    for percentile in JS_FORECAST_PERCENTILES:
+        needed = sprints[max(0, math.ceil(percentile * len(sprints) / 100.0) - 1)]
+        if needed >= JS_FORECAST_MAX_SPRINTS:
+            # the runs were cut off at the cap, the scope is not burned within the simulated horizon
+            forecast['p' + str(percentile)] = None
+        else:
+            forecast['p' + str(percentile)] = str(today + datetime.timedelta(days=needed * sprint_days))
+    return forecast
+
+
 def get_jira_url_issues(jql, postfix):
     return JS_BASE_URL + '/issues/?jql=' + urllib.parse.quote(jql + postfix)
 
 
+def get_jira_url_sprints(rapid_view_id):
+    return JS_BASE_URL + '/rest/greenhopper/1.0/sprintquery/' + str(rapid_view_id) + '?includeHistoricsprints=true&includeFuturesprints=true'
+
+
 def get_jira_url_velocity(rapid_view_id):
     return JS_BASE_URL + '/secure/RapidBoard.jspa?view=reporting&chart=velocityChart&rapidView=' + str(rapid_view_id)
 
@@ -76,16 +576,462 @@ def get_project_key_from_config_key(config_key):
     return config_key.strip().split('-')[0]
 
 
+def get_changelog_values(url, params):
+    values = []
+    start_at = 0
+    while True:
+        params['startAt'] = start_at
+        resp = jira_get(url, params)
+        if resp.status_code != 200:
+            raise JiraResponseError(resp.status_code)
+        page = resp.json()
+        values += page['values']
+        start_at += len(page['values'])
+        if len(page['values']) == 0 or page.get('isLast', True) or start_at >= page.get('total', 0):
+            return values
+
+
+def jira_complete_changelog(issue):
+    # search results carry at most one page of histories; the rest is fetched per issue
+    changelog = issue['changelog']
+    if changelog.get('total', 0) <= len(changelog['histories']):
+        return issue
+    url = JS_BASE_URL + '/rest/api/2/issue/' + issue['key']
+    try:
+        histories = get_changelog_values(url + '/changelog', {'maxResults': JS_PAGE_SIZE})
+    except JiraResponseError as e:
+        if e.status_code != 404:
+            raise
+        resp = jira_get(url, {'expand': 'changelog', 'fields': JS_STATUS_FIELD})
+        if resp.status_code != 200:
+            raise JiraResponseError(resp.status_code)
+        histories = resp.json()['changelog']['histories']
+    issue['changelog'] = {'startAt': 0, 'maxResults': len(histories), 'total': len(histories), 'histories': histories}
+    return issue
+
+
+def get_rapidview_name(name):
+    return name.strip().lower().replace('closed/', '')
+
+
+def get_issue_types_from_str(issue_types):
+    return [t.strip().strip('"\'').lower() for t in issue_types.split(',') if len(t.strip()) > 0]
+
+
+def get_plannable_issue_types(condition):
+    # only plain or quoted issue type names can be matched client-side; ids, functions and other clauses cannot
+    if condition == '':
+        return None
+    match = re.match(r'^ AND issuetype IN \((.*)\)$', condition)
+    if match is None:
+        return False
+    tokens = match.group(1).split(',')
+    if not all([re.match(r'^\s*("[^"]*"|\'[^\']*\'|[A-Za-z][\w -]*)\s*$', t) for t in tokens]):
+        return False
+    return set(get_issue_types_from_str(match.group(1)))
+
+
+class QueryPlanner:
+    # answers the dataset and times_in searches of a whole run with one "project in (...)" search per batch of projects and query shape;
+    # the issues are split by project and issue type client-side, and each project's slice is released after its last expected read
+    ESTIMATE_FIELDS = [JS_STORYPOINTS_FIELD, JS_TIMEESTIMATE_FIELD, JS_CREATED_FIELD, JS_RESOLUTION_FIELD, JS_RESOLUTIONDATE_FIELD, JS_ISSUETYPE_FIELD,
+                       JS_PROJECT_FIELD]
+    DONE_FIELDS = [JS_CREATED_FIELD, JS_STATUS_FIELD, JS_PROJECT_FIELD]
+
+    def __init__(self):
+        self.estimate_projects = {}
+        self.estimate_reads = {}
+        self.done_projects = []
+        self.results = {}
+        self.lock = Lock()
+
+    def add_project(self, project_key, config):
+        if config is None:
+            return
+        project_key = project_key.upper()
+        self.done_projects.append(project_key)
+        if config['datasets'] is None:
+            self.estimate_projects[project_key] = None
+            self.estimate_reads[project_key] = 1
+            return
+        issue_types = set()
+        reads = 0
+        for ds in config['datasets']:
+            ds_issue_types = get_plannable_issue_types(' AND issuetype IN (' + ds['issue_types'] + ')')
+            if ds_issue_types:
+                issue_types.update(ds_issue_types)
+                reads += 1
+        if len(issue_types) > 0:
+            self.estimate_projects[project_key] = issue_types
+            self.estimate_reads[project_key] = reads
+
+    def get_batch(self, project_keys, project_key):
+        project_keys = sorted(project_keys)
+        start = project_keys.index(project_key) // JS_PLANNER_BATCH_SIZE * JS_PLANNER_BATCH_SIZE
+        return project_keys[start:start + JS_PLANNER_BATCH_SIZE]
+
+    def get_estimates_jql(self, batch):
+        jql = 'project in (' + ', '.join(batch) + ')'
+        issue_types = set()
+        for project_key in batch:
+            if self.estimate_projects[project_key] is None:
+                return jql
+            issue_types.update(self.estimate_projects[project_key])
+        return jql + ' AND issuetype in (' + ', '.join(['"' + t + '"' for t in sorted(issue_types)]) + ')'
+
+    def search(self, jql, reads, project_key, fields, expand=''):
+        # identical JQL is only sent once per run; the first caller downloads it while the others wait for the result
+        with self.lock:
+            if jql not in self.results.keys():
+                self.results[jql] = {'lock': Lock(), 'issues': None, 'reads': dict(reads), 'status_code': None}
+            result = self.results[jql]
+        with result['lock']:
+            if result['status_code'] is not None:
+                raise JiraResponseError(result['status_code'])
+            if result['issues'] is None:
+                issues = {}
+                try:
+                    for issue in jira_search(jql, fields, expand):
+                        if expand == 'changelog':
+                            issue = jira_complete_changelog(issue)
+                        issues.setdefault(issue['fields'][JS_PROJECT_FIELD]['key'].upper(), []).append(issue)
+                except JiraResponseError as e:
+                    # a rejected batch is not retried by the other projects of the batch
+                    result['status_code'] = e.status_code
+                    raise
+                result['issues'] = issues
+        with self.lock:
+            issues = result['issues'].get(project_key, [])
+            result['reads'][project_key] -= 1
+            if result['reads'][project_key] <= 0:
+                result['issues'].pop(project_key, None)
+                del result['reads'][project_key]
+                if len(result['reads']) == 0:
+                    del self.results[jql]
+        return issues
+
+    def is_planned_dataset(self, project_key, condition):
+        project_key = project_key.upper()
+        issue_types = get_plannable_issue_types(condition)
+        if project_key not in self.estimate_projects.keys() or issue_types is False:
+            return False
+        return issue_types is None or self.estimate_projects[project_key] is None or issue_types <= self.estimate_projects[project_key]
+
+    def is_planned_done(self, project_key):
+        return project_key.upper() in self.done_projects
+
+    def get_batches(self, project_keys):
+        project_keys = sorted(project_keys)
+        return [project_keys[i:i + JS_PLANNER_BATCH_SIZE] for i in range(0, len(project_keys), JS_PLANNER_BATCH_SIZE)]
+
+    def get_plan(self):
+        plan = []
+        for batch in self.get_batches(self.estimate_projects.keys()):
+            plan.append(('datasets of ' + ','.join(batch), get_search_pages(self.get_estimates_jql(batch))))
+        for batch in self.get_batches(self.done_projects):
+            plan.append(('times_in of ' + ','.join(batch), get_search_pages('project in (' + ', '.join(batch) + ') AND status in (Done)')))
+        return plan
+
+    def get_dataset_issues(self, project_key, condition):
+        project_key = project_key.upper()
+        if not self.is_planned_dataset(project_key, condition):
+            return None
+        issue_types = get_plannable_issue_types(condition)
+        batch = self.get_batch(self.estimate_projects.keys(), project_key)
+        try:
+            issues = self.search(self.get_estimates_jql(batch), {k: self.estimate_reads[k] for k in batch}, project_key, QueryPlanner.ESTIMATE_FIELDS)
+        except JiraResponseError as e:
+            log(str(e.status_code) + ' for the datasets of ' + ','.join(batch) + ', searching per project')
+            return None
+        if issue_types is None:
+            return issues
+        return [issue for issue in issues if (issue['fields'].get(JS_ISSUETYPE_FIELD) or {}).get('name', '').lower() in issue_types]
+
+    def get_done_issues(self, project_key):
+        project_key = project_key.upper()
+        if not self.is_planned_done(project_key):
+            return None
+        batch = self.get_batch(self.done_projects, project_key)
+        jql = 'project in (' + ', '.join(batch) + ') AND status in (Done)'
+        try:
+            return self.search(jql, {k: 1 for k in batch}, project_key, QueryPlanner.DONE_FIELDS, 'changelog')
+        except JiraResponseError as e:
+            log(str(e.status_code) + ' for the times_in of ' + ','.join(batch) + ', searching per project')
+            return None
+
+
+class ShardWriter:
+    # the output file becomes a small index; each project lands in <output name>/<project key>.json next to it
+    def __init__(self, index_path):
+        self.index_path = index_path
+        self.shard_dir = os.path.splitext(index_path)[0]
+        os.makedirs(self.shard_dir, exist_ok=True)
+
+    def get_shard_url(self, project_key):
+        return os.path.basename(self.shard_dir) + '/' + project_key + '.json'
+
+    def write_project(self, stats):
+        if JS_OUTPUT_COMPACT:
+            stats = get_compact_project(stats)
+        write_json_output(os.path.join(self.shard_dir, stats['project_key'] + '.json'), stats)
+
+    def write_index(self, stats_obj):
+        projects = []
+        for stats in stats_obj['projects']:
+            projects.append({'project_key': stats['project_key'], 'title': stats['title'], 'url': self.get_shard_url(stats['project_key']),
+                             'datasets': [ds['name'] for ds in stats['datasets']]})
+        index = {'sharded': True, 'projects': projects, 'generated_at': stats_obj['generated_at']}
+        write_json_output(self.index_path, index)
+
+
+class RunMetadata:
+    # fetched once per run and shared read-only by every fetcher
+    def __init__(self, config_descriptions):
+        self.config_descriptions = config_descriptions
+        self.project_names = None
+        self.rapid_views = None
+
+    def load(self):
+        resp = jira_get(JS_BASE_URL + '/rest/api/2/project')
+        if resp.status_code == 200:
+            self.project_names = {}
+            for project in resp.json():
+                if 'key' in project.keys() and 'name' in project.keys():
+                    self.project_names[project['key'].upper()] = project['name']
+        else:
+            log(resp.status_code)
+        resp = jira_get(JS_BASE_URL + '/rest/greenhopper/1.0/rapidviews/list')
+        if resp.status_code == 200:
+            self.rapid_views = {}
+            views = resp.json()
+            if 'views' in views.keys():
+                for view in views['views']:
+                    # keep the first board with a given name, as the linear scan did
+                    self.rapid_views.setdefault(view['name'].strip().lower(), view['id'])
+        else:
+            log(resp.status_code)
+        return self
+
+
+class AsyncScheduler:
+    # bridges blocking fetcher code onto one event loop; requests run on a bounded executor over the shared session
+    def __init__(self, loop):
+        self.loop = loop
+        self.executor = ThreadPoolExecutor(JS_MAX_CONCURRENCY)
+
+    def get_in_context(self, context, url, params):
+        JS_metrics.set_context(context)
+        return jira_get(url, params)
+
+    async def get(self, context, url, params=None):
+        return await self.loop.run_in_executor(self.executor, self.get_in_context, context, url, params)
+
+    async def get_all(self, context, urls):
+        return await asyncio.gather(*[self.get(context, url) for url in urls])
+
+    def get_many(self, urls):
+        return asyncio.run_coroutine_threadsafe(self.get_all(JS_metrics.get_context(), urls), self.loop).result()
+
+    async def run_fetchers(self, fetchers, project_executor):
+        # a failing project is only logged; the others keep using the loop until they finish
+        results = await asyncio.gather(*[self.loop.run_in_executor(project_executor, fetcher.run) for fetcher in fetchers], return_exceptions=True)
+        for fetcher, result in zip(fetchers, results):
+            if isinstance(result, Exception):
+                log_fetcher_exception(fetcher, result)
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+
+async def run_fetchers_async(fetchers, project_executor):
+    scheduler = AsyncScheduler(asyncio.get_running_loop())
+    for fetcher in fetchers:
+        fetcher.scheduler = scheduler
+    try:
+        await scheduler.run_fetchers(fetchers, project_executor)
+    finally:
+        scheduler.shutdown()
+
+
+def run_fetchers_on_loop(fetchers):
+    # the project executor is shut down off the loop so a project still blocked in get_many can never deadlock it
+    project_executor = ThreadPoolExecutor(JS_MAX_PROJECTS)
+    try:
+        asyncio.run(run_fetchers_async(fetchers, project_executor))
+    finally:
+        project_executor.shutdown()
+
+
+class SqliteStore:
+    SCHEMA = []
+
+    def __init__(self, path):
+        self.path = path
+        self.local = local()
+        db = self.get_db()
+        db.execute('PRAGMA journal_mode=WAL')
+        for statement in self.SCHEMA:
+            db.execute(statement)
+        db.commit()
+
+    def get_db(self):
+        # sqlite connections cannot be shared between threads, so every fetcher gets its own
+        if not hasattr(self.local, 'db'):
+            self.local.db = sqlite3.connect(self.path, timeout=60)
+        return self.local.db
+
+
+class SprintCache(SqliteStore):
+    # reports of closed sprints never change, so only their extracted figures are kept
+    SCHEMA = ['CREATE TABLE IF NOT EXISTS sprints (rapid_view_id INTEGER, sprint_id INTEGER, summary TEXT, last_used REAL, '
+              'PRIMARY KEY (rapid_view_id, sprint_id))']
+
+    def get_summaries(self, rapid_view_id, sprint_ids):
+        summaries = {}
+        if len(sprint_ids) == 0:
+            return summaries
+        db = self.get_db()
+        params = [rapid_view_id] + sprint_ids
+        where = 'rapid_view_id = ? AND sprint_id IN (' + ','.join(['?'] * len(sprint_ids)) + ')'
+        for sprint_id, summary in db.execute('SELECT sprint_id, summary FROM sprints WHERE ' + where, params):
+            summaries[sprint_id] = json.loads(summary)
+        db.execute('UPDATE sprints SET last_used = ? WHERE ' + where, [time.time()] + params)
+        db.commit()
+        return summaries
+
+    def put_summaries(self, rapid_view_id, summaries):
+        if len(summaries) == 0:
+            return
+        db = self.get_db()
+        now = time.time()
+        db.executemany('INSERT OR REPLACE INTO sprints VALUES (?, ?, ?, ?)',
+                       [(rapid_view_id, sprint_id, json.dumps(summary), now) for sprint_id, summary in summaries.items()])
+        db.execute('DELETE FROM sprints WHERE rowid NOT IN (SELECT rowid FROM sprints ORDER BY last_used DESC LIMIT ?)', (JS_SPRINT_CACHE_SIZE,))
+        db.commit()
+
+    def invalidate(self, rapid_view_id=None, sprint_ids=None):
+        db = self.get_db()
+        if rapid_view_id is None:
+            cursor = db.execute('DELETE FROM sprints')
+        elif sprint_ids is None:
+            cursor = db.execute('DELETE FROM sprints WHERE rapid_view_id = ?', (rapid_view_id,))
+        else:
+            cursor = db.executemany('DELETE FROM sprints WHERE rapid_view_id = ? AND sprint_id = ?', [(rapid_view_id, s) for s in sprint_ids])
+        db.commit()
+        return cursor.rowcount
+
+
+class IssueMirror(SqliteStore):
+    MIRROR_FIELDS = [JS_STORYPOINTS_FIELD, JS_TIMEESTIMATE_FIELD, JS_CREATED_FIELD, JS_RESOLUTION_FIELD, JS_RESOLUTIONDATE_FIELD,
+                     JS_ISSUETYPE_FIELD, JS_STATUS_FIELD, JS_UPDATED_FIELD]
+    SCHEMA = ['CREATE TABLE IF NOT EXISTS issues (key TEXT PRIMARY KEY, project TEXT, issuetype TEXT, status TEXT, fields TEXT, changelog TEXT)',
+              'CREATE INDEX IF NOT EXISTS issues_project ON issues (project)',
+              'CREATE TABLE IF NOT EXISTS syncs (project TEXT PRIMARY KEY, last_sync TEXT, last_full_sync TEXT)']
+
+    def get_row(self, project_key, issue):
+        fields = issue['fields']
+        issuetype = fields[JS_ISSUETYPE_FIELD]['name'].lower() if fields.get(JS_ISSUETYPE_FIELD) is not None else ''
+        status = fields[JS_STATUS_FIELD]['name'].lower() if fields.get(JS_STATUS_FIELD) is not None else ''
+        changelog = json.dumps(issue['changelog']) if 'changelog' in issue.keys() else None
+        return (issue['key'], project_key, issuetype, status, json.dumps(fields), changelog)
+
+    def get_sync_state(self, project_key):
+        row = self.get_db().execute('SELECT last_sync, last_full_sync FROM syncs WHERE project = ?', (project_key,)).fetchone()
+        if row is None:
+            return (None, None)
+        return row
+
+    def is_full_sync_due(self, last_sync, last_full_sync):
+        if last_sync is None or last_full_sync is None:
+            return True
+        last_full_sync = datetime.datetime.strptime(last_full_sync, JS_DATE_FORMAT_JQL)
+        return datetime.datetime.now() - last_full_sync >= datetime.timedelta(days=JS_MIRROR_FULL_SYNC_DAYS)
+
+    def get_sync_jql(self, project_key, last_sync, full_sync):
+        jql = 'project=' + project_key
+        if not full_sync:
+            jql += ' AND updated >= "' + last_sync + '"'
+        return jql
+
+    def get_pending_sync_jql(self, project_key):
+        project_key = project_key.upper()
+        last_sync, last_full_sync = self.get_sync_state(project_key)
+        return self.get_sync_jql(project_key, last_sync, self.is_full_sync_due(last_sync, last_full_sync))
+
+    def sync(self, project_key):
+        # deltas are found with "updated >= last_sync"; deleted or moved issues only disappear on the periodic full sync
+        project_key = project_key.upper()
+        db = self.get_db()
+        last_sync, last_full_sync = self.get_sync_state(project_key)
+        full_sync = self.is_full_sync_due(last_sync, last_full_sync)
+        jql = self.get_sync_jql(project_key, last_sync, full_sync)
+        seen_keys = []
+        max_updated = None
+        rows = []
+        for issue in jira_search(jql, IssueMirror.MIRROR_FIELDS, 'changelog'):
+            rows.append(self.get_row(project_key, jira_complete_changelog(issue)))
+            seen_keys.append(issue['key'])
+            updated = issue['fields'].get(JS_UPDATED_FIELD)
+            if updated is not None and (max_updated is None or updated[:19] > max_updated):
+                max_updated = updated[:19]
+            if len(rows) >= JS_PAGE_SIZE:
+                # commit every page so the write lock is not held while the next page is downloaded
+                db.executemany('INSERT OR REPLACE INTO issues VALUES (?, ?, ?, ?, ?, ?)', rows)
+                db.commit()
+                rows = []
+        db.executemany('INSERT OR REPLACE INTO issues VALUES (?, ?, ?, ?, ?, ?)', rows)
+        if full_sync:
+            db.execute('CREATE TEMP TABLE IF NOT EXISTS seen_keys (key TEXT PRIMARY KEY)')
+            db.execute('DELETE FROM seen_keys')
+            db.executemany('INSERT OR IGNORE INTO seen_keys VALUES (?)', [(k,) for k in seen_keys])
+            db.execute('DELETE FROM issues WHERE project = ? AND key NOT IN (SELECT key FROM seen_keys)', (project_key,))
+            last_full_sync = datetime.datetime.now().strftime(JS_DATE_FORMAT_JQL)
+        if max_updated is not None:
+            # Jira only filters "updated" to the minute, so step back a little to never miss an edit
+            next_sync = datetime.datetime.strptime(max_updated, JS_DATE_FORMAT_HISTORY) - datetime.timedelta(minutes=JS_MIRROR_OVERLAP_MINUTES)
+            last_sync = next_sync.strftime(JS_DATE_FORMAT_JQL)
+        if last_sync is not None:
+            db.execute('INSERT OR REPLACE INTO syncs VALUES (?, ?, ?)', (project_key, last_sync, last_full_sync))
+        db.commit()
+        return len(seen_keys)
+
+    def get_issues(self, project_key, issue_types=None, statuses=None):
+        query = 'SELECT key, fields, changelog FROM issues WHERE project = ?'
+        params = [project_key.upper()]
+        if issue_types is not None:
+            query += ' AND issuetype IN (' + ','.join(['?'] * len(issue_types)) + ')'
+            params += issue_types
+        if statuses is not None:
+            query += ' AND status IN (' + ','.join(['?'] * len(statuses)) + ')'
+            params += statuses
+        cursor = self.get_db().execute(query, params)
+        while True:
+            rows = cursor.fetchmany(JS_PAGE_SIZE)
+            if len(rows) == 0:
+                break
+            for key, fields, changelog in rows:
+                issue = {'key': key, 'fields': json.loads(fields)}
+                if changelog is not None:
+                    issue['changelog'] = json.loads(changelog)
+                yield issue
+
+
 class StatsFetcher(Thread):
-    def __init__(self, config_key, archive):
+    def __init__(self, config_key, mirror=None, scheduler=None, sprint_cache=None, metadata=None, shard_writer=None, planner=None):
         super().__init__()
+        self.planner = planner
+        self.metadata = metadata
+        self.shard_writer = shard_writer
         self.config_key = config_key
-        self.archive = archive
+        self.mirror = mirror
+        self.scheduler = scheduler
+        self.sprint_cache = sprint_cache
         self.project_key = get_project_key_from_config_key(self.config_key)
         self.stats = None
-        self.transitions = []
 
     def get_project_name_from_key(self, key):
+        if self.metadata is not None and self.metadata.project_names is not None and key.upper() in self.metadata.project_names.keys():
+            return self.metadata.project_names[key.upper()]
         resp = jira_get(JS_BASE_URL + '/rest/api/2/project/' + key)
         if resp.status_code == 200:
             resp = json.loads(resp.text)
@@ -95,48 +1041,49 @@ class StatsFetcher(Thread):
             log(resp.status_code)
         return None
 
-    def calculate_story_points(self, resp):
+    def calculate_story_points(self, issues):
         total_sp = 0
-        if 'issues' in resp.keys():
-            for issue in resp['issues']:
-                if 'fields' in issue.keys():
-                    if JS_STORYPOINTS_FIELD in issue['fields'].keys():
-                        story_points = issue['fields'][JS_STORYPOINTS_FIELD]
-                        if story_points is not None:
-                            total_sp += int(story_points)
+        for issue in issues:
+            if 'fields' in issue.keys():
+                if JS_STORYPOINTS_FIELD in issue['fields'].keys():
+                    story_points = issue['fields'][JS_STORYPOINTS_FIELD]
+                    if story_points is not None:
+                        total_sp += int(story_points)
         return total_sp
 
     def get_story_points(self, jql):
-        resp = jira_search(jql, JS_MAX_RESULTS)
-        if resp.status_code == 200:
-            return self.calculate_story_points(resp.json())
-        else:
-            log(resp.status_code)
+        try:
+            return self.calculate_story_points(jira_search(jql, [JS_STORYPOINTS_FIELD]))
+        except JiraResponseError as e:
+            log(e.status_code)
         return None
 
-    def calculate_time_estimate(self, resp):
+    def calculate_time_estimate(self, issues):
         total_time_in_seconds = 0
-        if 'issues' in resp.keys():
-            for issue in resp['issues']:
-                if 'fields' in issue:
-                    if JS_TIMEESTIMATE_FIELD in issue['fields'].keys():
-                        orig_est = issue['fields'][JS_TIMEESTIMATE_FIELD]
-                        if orig_est is not None:
-                            total_time_in_seconds += int(orig_est)
+        for issue in issues:
+            if 'fields' in issue:
+                if JS_TIMEESTIMATE_FIELD in issue['fields'].keys():
+                    orig_est = issue['fields'][JS_TIMEESTIMATE_FIELD]
+                    if orig_est is not None:
+                        total_time_in_seconds += int(orig_est)
         return int(total_time_in_seconds / 3600 / 8)
 
     def get_time_estimate(self, jql):
-        resp = jira_search(jql, JS_MAX_RESULTS)
-        if resp.status_code == 200:
-            return self.calculate_time_estimate(resp.json())
-        else:
-            log(resp.status_code)
+        try:
+            return self.calculate_time_estimate(jira_search(jql, [JS_TIMEESTIMATE_FIELD]))
+        except JiraResponseError as e:
+            log(e.status_code)
         return None
 
+    def jira_get_many(self, urls):
+        if self.scheduler is not None:
+            return self.scheduler.get_many(urls)
+        return [jira_get(url) for url in urls]
+
     def get_rapidview_id(self, resp, project_name):
         if 'views' in resp.keys():
             for view in resp['views']:
-                if view['name'].strip().lower() == project_name.strip().lower().replace('closed/', ''):
+                if view['name'].strip().lower() == get_rapidview_name(project_name):
                     return view['id']
         return None
 
@@ -193,44 +1140,79 @@ class StatsFetcher(Thread):
         start = None
         if 'sprint' in resp.keys():
             start_date = resp['sprint']['startDate']
-            start = int(datetime.datetime.strptime(start_date, JS_DATE_FORMAT_SPRINT).timestamp())
+            try:
+                start = int(datetime.datetime.strptime(start_date, JS_DATE_FORMAT_SPRINT).timestamp())
+            except (TypeError, ValueError):
+                pass
         return start
 
-    def get_sprint_metrics(self, project_name):
+    def get_sprint_summary(self, resp):
+        return {'completed_sp': self.get_sprint_completed_sp(resp), 'ratios': self.get_sprint_ratios(resp), 'start': self.get_sprint_start(resp)}
+
+    def get_sprint_summaries(self, rapid_view_id, sprint_data):
+        summaries = {}
+        if self.sprint_cache is not None:
+            open_ids = [s_data[0] for s_data in sprint_data if not s_data[2]]
+            if len(open_ids) > 0:
+                # a reopened sprint must not be answered from the cache
+                self.sprint_cache.invalidate(rapid_view_id, open_ids)
+            summaries = self.sprint_cache.get_summaries(rapid_view_id, [s_data[0] for s_data in sprint_data if s_data[2]])
+        to_fetch = [s_data for s_data in sprint_data if s_data[0] not in summaries]
+        urls = [JS_BASE_URL + '/rest/greenhopper/1.0/rapid/charts/sprintreport?rapidViewId=' + str(rapid_view_id) + '&sprintId=' + str(s_data[0]) for s_data in to_fetch]
+        closed_summaries = {}
+        for s_data, resp in zip(to_fetch, self.jira_get_many(urls)):
+            sprint_id, sprint_name, sprint_closed = s_data
+            if resp.status_code == 200:
+                summaries[sprint_id] = self.get_sprint_summary(resp.json())
+                if sprint_closed:
+                    closed_summaries[sprint_id] = summaries[sprint_id]
+            else:
+                log(resp.status_code)
+        if self.sprint_cache is not None:
+            self.sprint_cache.put_summaries(rapid_view_id, closed_summaries)
+        return summaries
+
+    def find_rapidview_id(self, project_name):
+        if self.metadata is not None and self.metadata.rapid_views is not None:
+            return self.metadata.rapid_views.get(get_rapidview_name(project_name))
         resp = jira_get(JS_BASE_URL + '/rest/greenhopper/1.0/rapidviews/list')
         if resp.status_code == 200:
-            rapid_view_id = self.get_rapidview_id(resp.json(), project_name)
-            if rapid_view_id is not None:
-                resp = jira_get(JS_BASE_URL + '/rest/greenhopper/1.0/sprintquery/' + str(rapid_view_id) + '?includeHistoricsprints=true&includeFuturesprints=true')
-                if resp.status_code == 200:
-                    sprint_data = self.get_sprint_data(resp.json())
-                    story_points = []
-                    ratios = []
-                    for s_data in sprint_data:
-                        sprint_id, sprint_name, sprint_closed = s_data
-                        resp = jira_get(JS_BASE_URL + '/rest/greenhopper/1.0/rapid/charts/sprintreport?rapidViewId=' + str(rapid_view_id) + '&sprintId=' + str(sprint_id))
-                        if resp.status_code == 200:
-                            resp_json = resp.json()
-                            if sprint_closed:
-                                sp = self.get_sprint_completed_sp(resp_json)
-                                if sp is not None:
-                                    story_points.append(sp)
-                            # sprint_start = self.get_sprint_start(resp_json)
-                            # ratio = self.get_sprint_ratios(resp_json)
-                            ratio = None
-                            if ratio is not None:
-                                pass  # ratios.append({'sprint_id': sprint_id, 'sprint_name': sprint_name, 'sprint_start': sprint_start, 'features2bugs': ratio})
-                        else:
-                            log(resp.status_code)
-                    average_velocity = int(sum(story_points) / max(1, len(story_points)))
-                    # ratios.sort(key=lambda r: r['sprint_start'])
-                    return (average_velocity, rapid_view_id, ratios)
-                else:
-                    log(resp.status_code)
+            return self.get_rapidview_id(resp.json(), project_name)
+        log(resp.status_code)
+        return None
+
+    def get_sprint_metrics(self, project_name):
+        rapid_view_id = self.find_rapidview_id(project_name)
+        if rapid_view_id is not None:
+            resp = jira_get(get_jira_url_sprints(rapid_view_id))
+            if resp.status_code == 200:
+                sprint_data = self.get_sprint_data(resp.json())
+                story_points = []
+                ratios = []
+                sprint_starts = []
+                summaries = self.get_sprint_summaries(rapid_view_id, sprint_data)
+                for s_data in sprint_data:
+                    sprint_id, sprint_name, sprint_closed = s_data
+                    if sprint_id in summaries:
+                        summary = summaries[sprint_id]
+                        if summary['start'] is not None:
+                            sprint_starts.append(datetime.date.fromtimestamp(summary['start']))
+                        if sprint_closed:
+                            sp = summary['completed_sp']
+                            if sp is not None:
+                                story_points.append(sp)
+                        # sprint_start = summary['start']
+                        # ratio = summary['ratios']
+                        ratio = None
+                        if ratio is not None:
+                            pass  # ratios.append({'sprint_id': sprint_id, 'sprint_name': sprint_name, 'sprint_start': sprint_start, 'features2bugs': ratio})
+                average_velocity = int(sum(story_points) / max(1, len(story_points)))
+                # ratios.sort(key=lambda r: r['sprint_start'])
+                return (average_velocity, rapid_view_id, ratios, sprint_starts, story_points)
             else:
-                log('cannot find rapidview')
+                log(resp.status_code)
         else:
-            log(resp.status_code)
+            log('cannot find rapidview')
         return None
 
     def parse_config(self, config):
@@ -239,9 +1221,11 @@ class StatsFetcher(Thread):
             if 'estimate_type' in keys and JS_ESTIMATE_MD == config['estimate_type'].strip().lower():
                 get_estimate_fn = self.get_time_estimate
                 estimate_type = JS_ESTIMATE_MD
+                estimate_field = JS_TIMEESTIMATE_FIELD
             else:
                 get_estimate_fn = self.get_story_points
                 estimate_type = JS_EXTIMATE_SP
+                estimate_field = JS_STORYPOINTS_FIELD
             if 'title' in keys:
                 title = config['title']
             else:
@@ -257,92 +1241,202 @@ class StatsFetcher(Thread):
             datasets = None
             if 'datasets' in config and config['datasets'] is not None and len(config['datasets']) >= JS_MINIMUM_DATASETS:
                 datasets = config['datasets']
+            refresh_minutes = None
+            if 'refresh_minutes' in keys:
+                refresh_minutes = int(config['refresh_minutes'])
+            granularity = config.get('granularity', JS_GRANULARITY_WEEK)
             return {'start_date': config['start_date'], 'end_date': config['end_date'], 'get_estimate_fn': get_estimate_fn,
-                    'estimate_type': estimate_type, 'title': title, 'url_postfix': url_postfix, 'milestones': milestones,
-                    'datasets': datasets}
+                    'estimate_type': estimate_type, 'estimate_field': estimate_field, 'title': title, 'url_postfix': url_postfix, 'milestones': milestones,
+                    'datasets': datasets, 'refresh_minutes': refresh_minutes, 'granularity': granularity}
+        return None
+
+    def parse_config_description(self, descr):
+        if descr is not None:
+            for line in [l.strip() for l in descr.splitlines()]:
+                if len(line) > 0:
+                    comment_sign = line.find('#')
+                    if comment_sign < 0 or comment_sign > 4:
+                        try:
+                            return self.parse_config(json.loads(line))
+                        except Exception as e:
+                            log(e)
         return None
 
     def get_project_config(self, config_key):
+        if self.metadata is not None and config_key in self.metadata.config_descriptions.keys():
+            return self.parse_config_description(self.metadata.config_descriptions[config_key])
         resp = jira_get(JS_BASE_URL + '/rest/api/2/issue/' + config_key + '?fields=' + JS_CONFIG_FIELD)
         if resp.status_code == 200:
             issue = json.loads(resp.text)
             if 'fields' in issue.keys() and JS_CONFIG_FIELD in issue['fields'].keys():
-                descr = issue['fields'][JS_CONFIG_FIELD]
-                for line in [l.strip() for l in descr.splitlines()]:
-                    if len(line) > 0:
-                        comment_sign = line.find('#')
-                        if comment_sign < 0 or comment_sign > 4:
-                            try:
-                                return self.parse_config(json.loads(line))
-                            except Exception as e:
-                                log(e)
+                return self.parse_config_description(issue['fields'][JS_CONFIG_FIELD])
         else:
             log(resp.status_code)
         return None
 
-    def get_time_in_status(self, status, issue):
-        dt = datetime.timedelta()
-        length = len(issue['changelog']['histories'])
-        for i in range(length):
-            hs = issue['changelog']['histories'][i]
+    def add_times_in_statuses(self, issue, time_spent, now):
+        # walks the status transitions once: each one closes the interval of the status it leaves
+        fields = issue['fields']
+        status_since = datetime.datetime.fromisoformat(fields[JS_CREATED_FIELD][:19])
+        status = None
+        histories = sorted(issue['changelog']['histories'], key=lambda hs: hs['created'])
+        for hs in histories:
             for item in hs['items']:
-                if item['field'] == 'status' and item['fromString'].upper() == status.upper() and i > 0:
-                    start = datetime.datetime.strptime(hs['created'][:19], JS_DATE_FORMAT_HISTORY)
-                    he = issue['changelog']['histories'][i-1]
-                    end = datetime.datetime.strptime(he['created'][:19], JS_DATE_FORMAT_HISTORY)
-                    dt += (start - end)
-                    break
-            self.transitions.append((issue['key'], hs['author']['displayName']))
-        return int(dt.total_seconds())
+                if item['field'] == 'status':
+                    changed_at = datetime.datetime.fromisoformat(hs['created'][:19])
+                    from_status = (item['fromString'] or '').upper()
+                    time_spent[from_status] = time_spent.get(from_status, 0) + int((changed_at - status_since).total_seconds())
+                    status = (item['toString'] or '').upper()
+                    status_since = changed_at
+        if status is None and fields.get(JS_STATUS_FIELD) is not None:
+            status = fields[JS_STATUS_FIELD]['name'].upper()
+        if status is not None:
+            time_spent[status] = time_spent.get(status, 0) + int((now - status_since).total_seconds())
 
     def get_times_in(self):
         jql = 'project=' + self.project_key + ' AND status in (Done)'
-        time_spent = {'ART CREATION': 0, 'ASSETS': 0, 'READY FOR CODING': 0, 'CODING': 0, 'READY FOR TESTING': 0, 'TESTING': 0, 'TESTING BLOCKED': 0}
-        resp = jira_search(jql, JS_MAX_RESULTS, ['fixVersions'], 'changelog')
-        if resp.status_code == 200:
-            issues = resp.json()
-            if 'issues' in issues.keys():
-                for issue in issues['issues']:
-                    for status in time_spent.keys():
-                        time_spent[status] += self.get_time_in_status(status, issue)
-        else:
-            log(resp.status_code)
-        time_spent_array = [{'name': k, 'value': time_spent[k]} for k in time_spent.keys()]
+        time_spent = {}
+        now = datetime.datetime.now()
+        issues = None
+        if self.mirror is not None:
+            issues = self.mirror.get_issues(self.project_key, statuses=['done'])
+        elif self.planner is not None:
+            issues = self.planner.get_done_issues(self.project_key)
+        if issues is None:
+            issues = (jira_complete_changelog(issue) for issue in jira_search(jql, [JS_CREATED_FIELD, JS_STATUS_FIELD], 'changelog'))
+        try:
+            for issue in issues:
+                self.add_times_in_statuses(issue, time_spent, now)
+        except JiraResponseError as e:
+            log(e.status_code)
+        time_spent_array = [{'name': k, 'value': time_spent.get(k, 0)} for k in JS_TIMES_IN_STATUSES]
         return time_spent_array
 
-    def get_stats_datasets(self, config):
+    def get_total_to_date_jql(self, ds, day):
+        return 'project=' + self.project_key + ' AND createdDate <= "' + day + '"' + ds['condition']
+
+    def get_burned_to_date_jql(self, ds, day):
+        return 'project=' + self.project_key + ' AND resolution != Unresolved AND resolutiondate <= "' + day + '"' + ds['condition']
+
+    def get_dataset_estimates(self, config, ds):
         get_estimate_fn = config['get_estimate_fn']
+        jql = 'project=' + self.project_key + ds['condition']
+        total_est = get_estimate_fn(jql)
+        resolved_est = get_estimate_fn(jql + ' AND resolution != Unresolved')
+        total_estimates_to_date = [get_estimate_fn(self.get_total_to_date_jql(ds, day)) for day in ds['days']]
+        resolved_estimates_to_date = [get_estimate_fn(self.get_burned_to_date_jql(ds, day)) for day in ds['days']]
+        return (total_est, resolved_est, total_estimates_to_date, resolved_estimates_to_date)
+
+    def get_issue_estimate(self, issue, estimate_field):
+        if 'fields' in issue.keys() and estimate_field in issue['fields'].keys():
+            estimate = issue['fields'][estimate_field]
+            if estimate is not None:
+                return int(estimate)
+        return 0
+
+    def convert_estimate(self, config, estimate):
+        if config['estimate_type'] == JS_ESTIMATE_MD:
+            return int(estimate / 3600 / 8)
+        return estimate
+
+    def get_estimates_to_date_vectorized(self, dated_estimates, days):
+        if len(dated_estimates) == 0:
+            return [0] * len(days)
+        timestamps = numpy.array([d[0] for d in dated_estimates], dtype='datetime64[s]')
+        estimates = numpy.array([d[1] for d in dated_estimates], dtype=numpy.int64)
+        order = numpy.argsort(timestamps, kind='stable')
+        cumulative = numpy.concatenate(([0], numpy.cumsum(estimates[order])))
+        day_starts = numpy.array([day + JS_DAY_START for day in days], dtype='datetime64[s]')
+        return cumulative[numpy.searchsorted(timestamps[order], day_starts, side='right')].tolist()
+
+    def get_estimates_to_date(self, dated_estimates, days):
+        if numpy is not None:
+            return self.get_estimates_to_date_vectorized(dated_estimates, days)
+        # JQL "<= day" compares against the start of that day, so an issue counts once its timestamp is at or before midnight
+        dated_estimates.sort()
+        estimates_to_date = []
+        estimate_sum = 0
+        i = 0
+        for day in days:
+            day_start = day + JS_DAY_START
+            while i < len(dated_estimates) and dated_estimates[i][0] <= day_start:
+                estimate_sum += dated_estimates[i][1]
+                i += 1
+            estimates_to_date.append(estimate_sum)
+        return estimates_to_date
+
+    def get_dataset_estimates_single_pass(self, config, ds):
+        jql = 'project=' + self.project_key + ds['condition']
+        fields = [config['estimate_field'], JS_CREATED_FIELD, JS_RESOLUTION_FIELD, JS_RESOLUTIONDATE_FIELD]
+        issues = None
+        if self.mirror is not None:
+            # the mirror matches issue type names only, other conditions are searched in Jira
+            issue_types = get_plannable_issue_types(ds['condition'])
+            if issue_types is not False:
+                issues = self.mirror.get_issues(self.project_key, None if issue_types is None else sorted(issue_types))
+        elif self.planner is not None:
+            issues = self.planner.get_dataset_issues(self.project_key, ds['condition'])
+        if issues is None:
+            issues = jira_search(jql, fields)
+        created = []
+        resolved = []
+        try:
+            for issue in issues:
+                estimate = self.get_issue_estimate(issue, config['estimate_field'])
+                issue_fields = issue['fields']
+                created.append((issue_fields[JS_CREATED_FIELD][:19], estimate))
+                if issue_fields.get(JS_RESOLUTION_FIELD) is not None and issue_fields.get(JS_RESOLUTIONDATE_FIELD) is not None:
+                    resolved.append((issue_fields[JS_RESOLUTIONDATE_FIELD][:19], estimate))
+        except JiraResponseError as e:
+            log(e.status_code)
+            return None
+        total_est = self.convert_estimate(config, sum([c[1] for c in created]))
+        resolved_est = self.convert_estimate(config, sum([r[1] for r in resolved]))
+        total_estimates_to_date = [self.convert_estimate(config, e) for e in self.get_estimates_to_date(created, ds['days'])]
+        resolved_estimates_to_date = [self.convert_estimate(config, e) for e in self.get_estimates_to_date(resolved, ds['days'])]
+        return (total_est, resolved_est, total_estimates_to_date, resolved_estimates_to_date)
+
+    def get_datasets(self, config, sprint_starts=None):
         datasets = []
         if 'datasets' in config and config['datasets'] is not None and len(config['datasets']) >= JS_MINIMUM_DATASETS:
             for ds in config['datasets']:
                 condition = ' AND issuetype IN (' + ds['issue_types'] + ')'
-                days = get_days_for_estimates(ds['start_date'], ds['end_date'])
-                datasets.append({'name': ds['name'], 'condition': condition, 'days': days, 'milestones': ds['milestones']})
+                issue_types = get_issue_types_from_str(ds['issue_types'])
+                granularity = ds.get('granularity', config['granularity'])
+                days = get_days_for_estimates(ds['start_date'], ds['end_date'], granularity, sprint_starts)
+                datasets.append({'name': ds['name'], 'condition': condition, 'issue_types': issue_types, 'days': days, 'milestones': ds['milestones'],
+                                 'granularity': granularity})
         else:
-            days = get_days_for_estimates(config['start_date'], config['end_date'])
-            datasets = [{'name': 'Development', 'condition': '', 'days': days, 'milestones': config['milestones']}]
+            days = get_days_for_estimates(config['start_date'], config['end_date'], config['granularity'], sprint_starts)
+            datasets = [{'name': 'Development', 'condition': '', 'issue_types': None, 'days': days, 'milestones': config['milestones'],
+                         'granularity': config['granularity']}]
+        return datasets
+
+    def is_single_pass(self, ds):
+        # the JQL engine sends two searches per point, datasets finer than weekly are computed in one pass whatever the engine
+        if JS_BURNDOWN_ENGINE in [JS_ENGINE_SINGLE_PASS, JS_ENGINE_PLANNED] or self.mirror is not None:
+            return True
+        step_days = get_step_days(ds['granularity'])
+        return step_days is not None and step_days < 7
+
+    def get_stats_datasets(self, config, sprint_starts=None):
         to_dates = []
-        for ds in datasets:
+        for ds in self.get_datasets(config, sprint_starts):
             jql = 'project=' + self.project_key + ds['condition']
-            total_est = get_estimate_fn(jql)
             total_est_url = get_jira_url_issues(jql, config['url_postfix'])
-            jql = 'project=' + self.project_key + ds['condition'] + ' AND resolution != Unresolved'
-            resolved_est = get_estimate_fn(jql)
+            remaining_est_url = get_jira_url_issues(jql + ' AND resolution != Unresolved', config['url_postfix'])
+            if self.is_single_pass(ds):
+                estimates = self.get_dataset_estimates_single_pass(config, ds)
+            else:
+                estimates = self.get_dataset_estimates(config, ds)
+            if estimates is None:
+                return None
+            total_est, resolved_est, total_estimates_to_date, resolved_estimates_to_date = estimates
             remaining_est = total_est - resolved_est
-            remaining_est_url = get_jira_url_issues(jql, config['url_postfix'])
             urls_to_date = {'total': [], 'burned': []}
-            total_estimates_to_date = []
-            resolved_estimates_to_date = []
-            for day in ds['days']:
-                jql = 'project=' + self.project_key + ' AND createdDate <= "' + day + '"' + ds['condition']
-                total_est_to_date = get_estimate_fn(jql)
-                urls_to_date['total'].append(get_jira_url_issues(jql, config['url_postfix']))
-                total_estimates_to_date.append(total_est_to_date)
             for day in ds['days']:
-                jql = 'project=' + self.project_key + ' AND resolution != Unresolved AND resolutiondate <= "' + day + '"' + ds['condition']
-                resolved_est_to_date = get_estimate_fn(jql)
-                urls_to_date['burned'].append(get_jira_url_issues(jql, config['url_postfix']))
-                resolved_estimates_to_date.append(resolved_est_to_date)
+                urls_to_date['total'].append(get_jira_url_issues(self.get_total_to_date_jql(ds, day), config['url_postfix']))
+                urls_to_date['burned'].append(get_jira_url_issues(self.get_burned_to_date_jql(ds, day), config['url_postfix']))
             remaining_estimates_to_date = [total_estimates_to_date[i] - resolved_estimates_to_date[i] for i in range(len(total_estimates_to_date))]
             to_date = {'total_scope_estimate': total_est, 'burned_scope_estimate': resolved_est, 'total_scope_url': total_est_url,
                        'burned_scope_url': remaining_est_url, 'total_estimates': total_estimates_to_date, 'burned_estimates': resolved_estimates_to_date,
@@ -351,85 +1445,184 @@ class StatsFetcher(Thread):
             to_dates.append(to_date)
         return to_dates
 
-    def get_project_stats(self):
+    def get_sprint_plan(self, project_name):
+        # (expected sprint requests, number of sprints)
+        rapid_view_id = self.find_rapidview_id(project_name) if project_name is not None else None
+        if rapid_view_id is None:
+            return (0, 0)
+        resp = jira_get(get_jira_url_sprints(rapid_view_id))
+        if resp.status_code != 200:
+            return (1, 0)
+        sprint_data = self.get_sprint_data(resp.json())
+        cached = {}
+        if self.sprint_cache is not None:
+            cached = self.sprint_cache.get_summaries(rapid_view_id, [s_data[0] for s_data in sprint_data if s_data[2]])
+        return (1 + len(sprint_data) - len(cached), len(sprint_data))
+
+    def get_plan(self):
+        # expected requests per step, from one count search per query; steps answered by the planner are counted per batch in print_plan.
+        # Page counts are exact, except for the JQL engine whose per-point searches are bounded by the dataset size; changelog overflow
+        # requests are not included
         config = self.get_project_config(self.config_key)
+        if config is None:
+            return []
+        plan = []
+        if self.mirror is not None:
+            plan.append(('mirror sync', get_search_pages(self.mirror.get_pending_sync_jql(self.project_key))))
+        sprint_requests, sprint_count = self.get_sprint_plan(self.get_project_name_from_key(self.project_key))
+        plan.append(('sprint reports', sprint_requests))
+        for ds in self.get_datasets(config):
+            count = 0
+            if self.planner is not None and self.planner.is_planned_dataset(self.project_key, ds['condition']):
+                plan.append(('dataset ' + ds['name'] + ' (batched)', 0))
+                continue
+            if self.mirror is None:
+                count = get_search_pages('project=' + self.project_key + ds['condition'])
+                if not self.is_single_pass(ds):
+                    points = len(ds['days'])
+                    if str(ds['granularity']).strip().lower() == JS_GRANULARITY_SPRINT and sprint_count > 0:
+                        # the sprint starts come with the sprint reports, a sprint granularity has at most one point per sprint after the start
+                        points = 1 + sprint_count
+                    count *= 2 + 2 * points
+            plan.append(('dataset ' + ds['name'], count))
+        if self.planner is not None and self.planner.is_planned_done(self.project_key):
+            plan.append(('times_in (batched)', 0))
+        elif self.mirror is None:
+            plan.append(('times_in', get_search_pages('project=' + self.project_key + ' AND status in (Done)')))
+        return plan
+
+    def get_project_stats(self):
+        with JS_metrics.phase('config'):
+            config = self.get_project_config(self.config_key)
         if config is None:
             return None
-        project_name = self.get_project_name_from_key(self.project_key)
+        if self.mirror is not None:
+            try:
+                with JS_metrics.phase('mirror'):
+                    log('mirror ' + self.project_key + ': ' + str(self.mirror.sync(self.project_key)) + ' issues synced')
+            except JiraResponseError as e:
+                log(e.status_code)
+                return None
+        with JS_metrics.phase('config'):
+            project_name = self.get_project_name_from_key(self.project_key)
         velocity_url = None
         average_velocity = None
         sprint_ratios = None
+        sprint_starts = None
+        velocities = []
         if project_name is not None:
-            sprint_metrics = self.get_sprint_metrics(project_name)
+            with JS_metrics.phase('sprint_metrics'):
+                sprint_metrics = self.get_sprint_metrics(project_name)
             if sprint_metrics is not None:
-                average_velocity, rapid_view_id, sprint_ratios = sprint_metrics
+                average_velocity, rapid_view_id, sprint_ratios, sprint_starts, velocities = sprint_metrics
                 if config['estimate_type'] == JS_ESTIMATE_MD:
                     average_velocity = int(average_velocity / 3600 / 8)
+                    velocities = [int(v / 3600 / 8) for v in velocities]
                 if rapid_view_id is not None:
                     velocity_url = get_jira_url_velocity(rapid_view_id)
         if config['title'] is None:
             title = self.project_key
         else:
             title = config['title']
-        datasets = self.get_stats_datasets(config)
-        # times_in = self.get_times_in()
-        times_in = None
+        with JS_metrics.phase('datasets'):
+            datasets = self.get_stats_datasets(config, sprint_starts)
+        if datasets is None:
+            return None
+        with JS_metrics.phase('forecast'):
+            sprint_days = get_sprint_days(sprint_starts)
+            for ds in datasets:
+                seed = zlib.crc32((self.project_key + '/' + ds['name']).encode('utf-8'))
+                ds['forecast'] = get_completion_forecast(velocities, ds['remaining_scope_estimate'], sprint_days, seed)
+        with JS_metrics.phase('times_in'):
+            times_in = self.get_times_in()
         stats = {'project_key': self.project_key, 'estimate_type': config['estimate_type'], 'average_velocity': average_velocity, 'velocity_url': velocity_url,
                  'sprint_ratios': sprint_ratios, 'times_in': times_in, 'title': title, 'datasets': datasets,
                  'milestones': config['milestones']}
-        # import itertools
-        # self.transitions.sort(key=lambda x: x[1])
-        # groups = []
-        # for group, groupped in itertools.groupby(self.transitions, lambda x: x[1]):
-        #     user_issues = list(groupped)
-        #     user_issues.sort(key=lambda x: x[0])
-        #     different_issues = 0
-        #     for g, g2 in itertools.groupby(user_issues, lambda x: x[0]):
-        #         different_issues += 1
-        #     groups.append((group, len(user_issues), different_issues))
-        # groups.sort(key=lambda x: x[2], reverse=True)
-        # print(project_name)
-        # for g in groups:
-        #     print(g)
-        # print()
         return stats
 
-    def get_archived(self):
-        if 'projects' in self.archive.keys():
-            projects = self.archive['projects']
-            for project in projects:
-                if 'project_key' in project:
-                    if self.project_key.upper() == project['project_key'].upper():
-                        return project
-        return None
+    def get_project_stats_profiled(self):
+        # only one profiler may be active per process since Python 3.12, so profiled projects run one at a time
+        with JS_profile_lock:
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                return self.get_project_stats()
+            finally:
+                profile.disable()
+                try:
+                    profile.dump_stats(os.path.join(JS_PROFILE_DIR, self.project_key + '.prof'))
+                except OSError as e:
+                    log(e)
 
     def run(self):
-        archived_stats = self.get_archived()
-        if archived_stats is None:
+        with JS_metrics.phase('total', self.project_key):
             log('fetch ' + self.project_key)
-            self.stats = self.get_project_stats()
-        else:
-            log('archive ' + self.project_key)
-            self.stats = archived_stats
+            try:
+                if JS_PROFILE_DIR is not None:
+                    self.stats = self.get_project_stats_profiled()
+                else:
+                    self.stats = self.get_project_stats()
+            except RunLimitExceeded as e:
+                log(e)
+                self.stats = None
+        if self.stats is not None:
+            self.stats['fetched_at'] = datetime.datetime.now().isoformat(sep=' ')[:19]
+        if self.stats is not None and self.shard_writer is not None:
+            try:
+                self.shard_writer.write_project(self.stats)
+            except OSError as e:
+                log(e)
 
 
 def get_config_keys_for_reporting():
+    # maps every config key to its description, so fetchers do not have to request their configs one by one
     jql = 'summary ~ "' + JS_CONFIG_ISSUE_NAME + '"'
-    resp = jira_search(jql)
-    if resp.status_code == 200:
-        issues = resp.json()
-        if 'issues' in issues.keys():
-            config_keys = []
-            for issue in issues['issues']:
-                config_key = issue['key']
-                config_keys.append(config_key)
-            return config_keys
-    else:
+    config_keys = {}
+    try:
+        for issue in jira_search(jql, ['summary', JS_CONFIG_FIELD]):
+            config_keys[issue['key']] = issue['fields'].get(JS_CONFIG_FIELD)
+    except JiraResponseError as e:
+        log(e.status_code)
+        return {}
+    return config_keys
+
+
+def get_archive_index(archive):
+    index = {}
+    if 'projects' in archive.keys():
+        for project in archive['projects']:
+            if 'project_key' in project:
+                index[project['project_key'].upper()] = project
+    return index
+
+
+def get_cached_archive(attachment):
+    if JS_ARCHIVE_CACHE_FILE is not None:
+        cached = load_json_file(JS_ARCHIVE_CACHE_FILE)
+        if cached is not None and cached.get('attachment_id') == attachment.get('id') and cached.get('size') == attachment.get('size'):
+            return cached['projects']
+    return None
+
+
+def download_archive(attachment):
+    resp = jira_get(attachment['content'])
+    if resp.status_code != 200:
         log(resp.status_code)
-    return []
+        return {}
+    try:
+        index = get_archive_index(resp.json())
+    except Exception:
+        return {}
+    if JS_ARCHIVE_CACHE_FILE is not None:
+        try:
+            write_file_atomic(JS_ARCHIVE_CACHE_FILE, json.dumps({'attachment_id': attachment.get('id'), 'size': attachment.get('size'), 'projects': index}))
+        except OSError as e:
+            log(e)
+    return index
 
 
 def get_archive(issue_key):
+    # returns archived project stats keyed by upper-case project key; the attachment is only downloaded when its id or size changed
     if issue_key is not None:
         resp = jira_get(JS_BASE_URL + '/rest/api/2/issue/' + issue_key + '?fields=attachment')
         if resp.status_code == 200:
@@ -440,52 +1633,472 @@ def get_archive(issue_key):
                     attachments = fields['attachment']
                     for attachment in attachments:
                         if attachment['filename'].lower() == 'archive.json':
-                            resp = jira_get(attachment['content'])
-                            if resp.status_code == 200:
-                                try:
-                                    return resp.json()
-                                except Exception:
-                                    return {}
-                            else:
-                                log(resp.status_code)
+                            cached = get_cached_archive(attachment)
+                            if cached is not None:
+                                return cached
+                            return download_archive(attachment)
         else:
             log(resp.status_code)
     return {}
 
 
+def merge_archive(stats_obj):
+    index = get_archive_index(load_json_file(JS_ARCHIVE_FILE) or {})
+    for project in stats_obj['projects']:
+        index[project['project_key'].upper()] = project
+    stats_obj['projects'] = list(index.values())
+
+
+def get_stats_obj(projects, generated_at=None):
+    stats_obj = {'projects': list(projects)}
+    # the project key breaks ties so the order does not depend on which process or thread fetched a project
+    stats_obj['projects'].sort(key=lambda p: (p['datasets'][0]['dates'][0], p['project_key']))
+    if generated_at is None:
+        generated_at = datetime.datetime.now().isoformat(sep=' ')[:19]
+    stats_obj['generated_at'] = generated_at
+    return stats_obj
+
+
+def load_previous_projects(path):
+    # the last written output, keyed by upper-case project key; projects written before fetched_at existed get the output's generated_at
+    previous = load_json_file(path)
+    projects = {}
+    if previous is None or 'projects' not in previous.keys():
+        return projects
+    for project in previous['projects']:
+        if previous.get('sharded', False):
+            project = load_json_file(os.path.join(os.path.dirname(os.path.abspath(path)), project['url']))
+            if project is None:
+                continue
+        project = dict(project)
+        project['datasets'] = [get_expanded_dataset(ds) for ds in project['datasets']]
+        if project.get('fetched_at') is None:
+            project['fetched_at'] = previous.get('generated_at')
+        projects[project['project_key'].upper()] = project
+    return projects
+
+
+def get_stale_stats(stats):
+    stale = dict(stats)
+    stale['stale'] = True
+    stale['age_seconds'] = None
+    if stale['fetched_at'] is not None:
+        stale['age_seconds'] = int((datetime.datetime.now() - datetime.datetime.fromisoformat(stale['fetched_at'])).total_seconds())
+    return stale
+
+
+def run_fetchers_limited(fetchers):
+    # projects start in the given order; whatever has not finished by the deadline is left behind
+    executor = ThreadPoolExecutor(JS_MAX_PROJECTS)
+    futures = [executor.submit(fetcher.run) for fetcher in fetchers]
+    wait(futures, timeout=JS_limits.get_remaining_seconds())
+    executor.shutdown(wait=False, cancel_futures=True)
+    for fetcher, future in zip(fetchers, futures):
+        if future.done() and not future.cancelled() and future.exception() is not None:
+            log_fetcher_exception(fetcher, future.exception())
+
+
+def print_plan(fetchers, planner, budget):
+    # the bootstrap requests were already sent to load the configs, the plan's own count searches are not part of a real run
+    total = JS_limits.used
+    print('%-12s %-32s %10s' % ('PROJECT', 'STEP', 'REQUESTS'))
+    print('%-12s %-32s %10d' % ('-', 'bootstrap', total))
+    for fetcher in fetchers:
+        for step, count in fetcher.get_plan():
+            print('%-12s %-32s %10d' % (fetcher.project_key, step, count))
+            total += count
+    if planner is not None:
+        for step, count in planner.get_plan():
+            print('%-12s %-32s %10d' % ('-', step, count))
+            total += count
+    print('%-12s %-32s %10d' % ('TOTAL', '', total))
+    if budget is not None and total > budget:
+        print('the plan exceeds JS_REQUEST_BUDGET=' + str(budget) + '; the least recently fetched projects go first')
+
+
+def parse_shard(spec):
+    try:
+        index, count = [int(p) for p in spec.split('/')]
+    except ValueError:
+        raise argparse.ArgumentTypeError('expected i/N, e.g. 0/4')
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError('expected 0 <= i < N')
+    return (index, count)
+
+
+def is_in_shard(project_key, shard):
+    # crc32 is stable across processes and machines, unlike hash()
+    return zlib.crc32(project_key.upper().encode('utf-8')) % shard[1] == shard[0]
+
+
+def merge_partial_outputs(paths):
+    projects = {}
+    generated_at = None
+    shards = {}
+    for path in paths:
+        partial = load_json_file(path)
+        if partial is None or 'projects' not in partial.keys():
+            log('cannot read partial output ' + path)
+            sys.exit(1)
+        if 'shard' in partial.keys():
+            index, count = partial['shard']
+            shards.setdefault(count, set()).add(index)
+        for project in partial['projects']:
+            if project['project_key'].upper() in projects.keys():
+                log('duplicate project ' + project['project_key'] + ' in ' + path)
+                continue
+            projects[project['project_key'].upper()] = project
+        if generated_at is None or partial['generated_at'] < generated_at:
+            generated_at = partial['generated_at']
+    for count, indexes in shards.items():
+        if len(indexes) != count:
+            log('missing shards of ' + str(count) + ': ' + ','.join([str(i) for i in range(count) if i not in indexes]))
+    return get_stats_obj(projects.values(), generated_at)
+
+
+def write_output(stats_obj, shard_writer):
+    if shard_writer is not None:
+        shard_writer.write_index(stats_obj)
+    elif JS_OUTPUT_COMPACT:
+        compact = {'projects': [get_compact_project(p) for p in stats_obj['projects']], 'generated_at': stats_obj['generated_at']}
+        write_json_output(JS_OUTPUT_JSON_FILE, compact)
+    else:
+        write_file_atomic(JS_OUTPUT_JSON_FILE, json.dumps(stats_obj))
+
+
+class StatsDaemon:
+    # keeps one warm fetcher per config key and only recomputes projects whose config or issues changed since their last refresh
+    def __init__(self, mirror, sprint_cache):
+        self.mirror = mirror
+        self.sprint_cache = sprint_cache
+        self.metadata = RunMetadata({})
+        self.metadata_loaded_at = None
+        self.shard_writer = ShardWriter(JS_OUTPUT_JSON_FILE) if JS_OUTPUT_SHARDED else None
+        self.fetchers = {}
+        self.projects = {}
+        self.executor = ThreadPoolExecutor(JS_MAX_PROJECTS)
+
+    def get_fetcher(self, config_key):
+        if config_key not in self.fetchers.keys():
+            self.fetchers[config_key] = StatsFetcher(config_key, self.mirror, sprint_cache=self.sprint_cache, metadata=self.metadata,
+                                                     shard_writer=self.shard_writer)
+        return self.fetchers[config_key]
+
+    def has_changed(self, project_key, state, description):
+        if state['stats'] is None or state['description'] != description:
+            return True
+        try:
+            return jira_search_total('project=' + project_key + ' AND updated >= "' + state['last_refresh'] + '"') > 0
+        except JiraResponseError as e:
+            log(e.status_code)
+            return True
+
+    def refresh(self):
+        now = datetime.datetime.now()
+        JS_limits.reset()
+        JS_metrics.start_run()
+        with JS_metrics.phase('bootstrap'):
+            keys = get_config_keys_for_reporting()
+            if len(keys) == 0:
+                return
+            self.metadata.config_descriptions = keys
+            if self.metadata_loaded_at is None or now - self.metadata_loaded_at >= datetime.timedelta(minutes=JS_DAEMON_INTERVAL_MINUTES):
+                self.metadata.load()
+                self.metadata_loaded_at = now
+        with JS_metrics.phase('archive'):
+            archive = get_archive(JS_ARCHIVE_ISSUE_KEY)
+        changed = False
+        for config_key in [k for k in self.projects.keys() if k not in keys.keys()]:
+            del self.projects[config_key]
+            changed = True
+        due = []
+        for config_key, description in keys.items():
+            project_key = get_project_key_from_config_key(config_key)
+            state = self.projects.setdefault(config_key, {'description': None, 'next_refresh': now, 'last_refresh': None, 'stats': None})
+            if project_key.upper() in archive.keys():
+                changed = changed or state['stats'] != archive[project_key.upper()]
+                state['stats'] = archive[project_key.upper()]
+                continue
+            if now < state['next_refresh']:
+                continue
+            fetcher = self.get_fetcher(config_key)
+            config = fetcher.parse_config_description(description)
+            interval = JS_DAEMON_INTERVAL_MINUTES
+            if config is not None and config['refresh_minutes'] is not None:
+                interval = config['refresh_minutes']
+            state['next_refresh'] = now + datetime.timedelta(minutes=interval)
+            if self.has_changed(project_key, state, description):
+                due.append((state, description, fetcher, self.executor.submit(fetcher.run)))
+        for state, description, fetcher, future in due:
+            try:
+                future.result()
+            except Exception as e:
+                log(e)
+                continue
+            if fetcher.stats is not None:
+                state['stats'] = fetcher.stats
+                state['description'] = description
+                state['last_refresh'] = (now - datetime.timedelta(minutes=JS_MIRROR_OVERLAP_MINUTES)).strftime(JS_DATE_FORMAT_JQL)
+                changed = True
+        if changed:
+            stats_obj = get_stats_obj([state['stats'] for state in self.projects.values() if state['stats'] is not None])
+            try:
+                write_output(stats_obj, self.shard_writer)
+            except OSError as e:
+                log(e)
+
+    def run_forever(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                log(e)
+            JS_metrics.write()
+            time.sleep(JS_DAEMON_TICK_SECONDS)
+
+
+class DashboardHandler(BaseHTTPRequestHandler):
+    # serves the dashboard and its data with strong ETags and gzip bodies compressed once per file version
+    protocol_version = 'HTTP/1.1'
+    file_cache = {}
+    file_cache_lock = Lock()
+
+    def resolve_path(self):
+        path = urllib.parse.unquote(urllib.parse.urlsplit(self.path).path)
+        if path.endswith('/'):
+            path += 'index.html'
+        extension = os.path.splitext(path)[1].lower()
+        if extension not in JS_DAEMON_EXTENSIONS:
+            return None
+        root = os.path.realpath(os.path.dirname(os.path.abspath(JS_OUTPUT_JSON_FILE)) if extension == '.json' else JS_DAEMON_ROOT)
+        full_path = os.path.realpath(os.path.join(root, path.lstrip('/')))
+        if not full_path.startswith(root + os.sep):
+            return None
+        return full_path
+
+    def get_file(self, full_path):
+        try:
+            stat = os.stat(full_path)
+        except OSError:
+            return None
+        version = (stat.st_mtime_ns, stat.st_size)
+        with self.file_cache_lock:
+            cached = self.file_cache.get(full_path)
+        if cached is not None and cached['version'] == version:
+            return cached
+        try:
+            with open(full_path, 'rb') as f:
+                body = f.read()
+        except OSError:
+            return None
+        etag = hashlib.sha1(body).hexdigest()
+        cached = {'version': version, 'body': body, 'etag': '"' + etag + '"', 'gzip_body': gzip.compress(body, 9), 'gzip_etag': '"' + etag + '-gz"',
+                  'content_type': mimetypes.guess_type(full_path)[0] or 'application/octet-stream'}
+        with self.file_cache_lock:
+            self.file_cache[full_path] = cached
+        return cached
+
+    def send_file(self, with_body):
+        full_path = self.resolve_path()
+        cached = self.get_file(full_path) if full_path is not None else None
+        if cached is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        use_gzip = 'gzip' in self.headers.get('Accept-Encoding', '')
+        body = cached['gzip_body'] if use_gzip else cached['body']
+        etag = cached['gzip_etag'] if use_gzip else cached['etag']
+        if_none_match = [t.strip() for t in self.headers.get('If-None-Match', '').split(',')]
+        if etag in if_none_match or '*' in if_none_match:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Vary', 'Accept-Encoding')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', cached['content_type'])
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Vary', 'Accept-Encoding')
+        if use_gzip:
+            self.send_header('Content-Encoding', 'gzip')
+        self.end_headers()
+        if with_body:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        self.send_file(True)
+
+    def do_HEAD(self):
+        self.send_file(False)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run_daemon():
+    mirror = None
+    if JS_MIRROR_DB is not None:
+        mirror = IssueMirror(JS_MIRROR_DB)
+    sprint_cache = None
+    if JS_SPRINT_CACHE_DB is not None:
+        sprint_cache = SprintCache(JS_SPRINT_CACHE_DB)
+    server = ThreadingHTTPServer((JS_DAEMON_HOST, JS_DAEMON_PORT), DashboardHandler)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, daemon=True).start()
+    log('serving dashboard on port ' + str(server.server_address[1]))
+    StatsDaemon(mirror, sprint_cache).run_forever()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Generate burn-up statistics from Jira.')
+    parser.add_argument('--archive-only', metavar='PROJECT_KEYS', help='fetch the given comma separated projects and merge them into ./archive.json')
+    parser.add_argument('--async', dest='use_async', action='store_true', help='fetch projects and sprint reports concurrently on one event loop')
+    parser.add_argument('--daemon', action='store_true', help='keep running, refresh projects on their intervals and serve the dashboard over HTTP')
+    parser.add_argument('--shard', metavar='I/N', type=parse_shard, help='only fetch the projects of partition I of N and write a partial output')
+    parser.add_argument('--merge', metavar='PARTIAL', nargs='+', help='combine partial outputs written with --shard into the output file and exit')
+    parser.add_argument('--plan', action='store_true',
+                        help='print the expected number of requests per project and dataset (an upper bound for the jql engine) and exit without fetching')
+    parser.add_argument('--invalidate-sprint-cache', metavar='RAPID_VIEW_ID[:SPRINT_IDS]', nargs='?', const='all',
+                        help='drop cached closed-sprint reports (all, one board, or comma separated sprints of a board) and exit')
+    return parser.parse_args()
+
+
+def invalidate_sprint_cache(spec):
+    if JS_SPRINT_CACHE_DB is None:
+        log('JS_SPRINT_CACHE_DB is not set')
+        return
+    sprint_cache = SprintCache(JS_SPRINT_CACHE_DB)
+    if spec == 'all':
+        removed = sprint_cache.invalidate()
+    else:
+        parts = spec.split(':')
+        sprint_ids = [int(s) for s in parts[1].split(',')] if len(parts) > 1 else None
+        removed = sprint_cache.invalidate(int(parts[0]), sprint_ids)
+    log('removed ' + str(removed) + ' cached sprint reports')
+
+
 def main():
-    create_archive = len(sys.argv) > 2 and sys.argv[1] == '--archive-only'
-    keys = get_config_keys_for_reporting()
+    args = parse_args()
+    if args.invalidate_sprint_cache is not None:
+        invalidate_sprint_cache(args.invalidate_sprint_cache)
+        return
+    if args.daemon:
+        run_daemon()
+        return
+    if args.merge is not None:
+        stats_obj = merge_partial_outputs(args.merge)
+        shard_writer = ShardWriter(JS_OUTPUT_JSON_FILE) if JS_OUTPUT_SHARDED else None
+        try:
+            if shard_writer is not None:
+                for stats in stats_obj['projects']:
+                    shard_writer.write_project(stats)
+            write_output(stats_obj, shard_writer)
+        except OSError as e:
+            log(e)
+            sys.exit(e.errno)
+        return
+    create_archive = args.archive_only is not None
+    previous = {}
+    if not create_archive:
+        previous = load_previous_projects(JS_OUTPUT_JSON_FILE)
+    try:
+        fetch_and_write(args, create_archive, previous)
+    except RunLimitExceeded as e:
+        log(e)
+        sys.exit(1)
+
+
+def fetch_and_write(args, create_archive, previous):
+    budget = JS_limits.budget
+    if args.plan:
+        JS_limits.suspend()
+    with JS_metrics.phase('bootstrap'):
+        keys = get_config_keys_for_reporting()
+    if args.shard is not None:
+        keys = {k: v for k, v in keys.items() if is_in_shard(get_project_key_from_config_key(k), args.shard)}
     if create_archive:
         archive = {}
-        project_ids = sys.argv[2].split(',')
+        project_ids = args.archive_only.split(',')
     else:
-        archive = get_archive(JS_ARCHIVE_ISSUE_KEY)
+        with JS_metrics.phase('archive'):
+            archive = get_archive(JS_ARCHIVE_ISSUE_KEY)
+    mirror = None
+    if JS_MIRROR_DB is not None:
+        mirror = IssueMirror(JS_MIRROR_DB)
+    sprint_cache = None
+    if JS_SPRINT_CACHE_DB is not None:
+        sprint_cache = SprintCache(JS_SPRINT_CACHE_DB)
+    with JS_metrics.phase('bootstrap'):
+        metadata = RunMetadata(keys).load()
+    shard_writer = None
+    if JS_OUTPUT_SHARDED and not create_archive and args.shard is None:
+        shard_writer = ShardWriter(JS_OUTPUT_JSON_FILE)
+    planner = None
+    if JS_BURNDOWN_ENGINE == JS_ENGINE_PLANNED and mirror is None:
+        planner = QueryPlanner()
     stats_obj = {'projects': []}
     fetchers = []
     for config_key in keys:
-        if create_archive and get_project_key_from_config_key(config_key) not in project_ids:
+        project_key = get_project_key_from_config_key(config_key)
+        if create_archive:
+            if project_key not in project_ids:
+                continue
+        elif project_key.upper() in archive.keys():
+            log('archive ' + project_key)
+            stats_obj['projects'].append(archive[project_key.upper()])
+            if shard_writer is not None:
+                shard_writer.write_project(archive[project_key.upper()])
             continue
-        fetcher = StatsFetcher(config_key, archive)
-        fetchers.append(fetcher)
-        fetcher.start()
+        fetchers.append(StatsFetcher(config_key, mirror, sprint_cache=sprint_cache, metadata=metadata, shard_writer=shard_writer, planner=planner))
+    if planner is not None:
+        for fetcher in fetchers:
+            planner.add_project(fetcher.project_key, fetcher.get_project_config(fetcher.config_key))
+    # never fetched projects sort first, then the least recently fetched ones
+    fetchers.sort(key=lambda f: previous.get(f.project_key.upper(), {}).get('fetched_at') or '')
+    if args.plan:
+        print_plan(fetchers, planner, budget)
+        return
+    if args.use_async:
+        run_fetchers_on_loop(fetchers)
+    elif JS_limits.is_limited():
+        run_fetchers_limited(fetchers)
+    else:
+        for fetcher in fetchers:
+            fetcher.start()
+        for fetcher in fetchers:
+            fetcher.join()
     for fetcher in fetchers:
-        fetcher.join()
         if fetcher.stats is not None:
             stats_obj['projects'].append(fetcher.stats)
-    stats_obj['projects'].sort(key=lambda p: p['datasets'][0]['dates'][0])
-    stats_obj['generated_at'] = datetime.datetime.now().isoformat(sep=' ')[:19]
-    stats_json = json.dumps(stats_obj)
+        elif fetcher.project_key.upper() in previous.keys():
+            stats = get_stale_stats(previous[fetcher.project_key.upper()])
+            log('keeping stats of ' + fetcher.project_key + ' fetched at ' + str(stats['fetched_at']))
+            stats_obj['projects'].append(stats)
+            if shard_writer is not None:
+                try:
+                    shard_writer.write_project(stats)
+                except OSError as e:
+                    log(e)
+    if create_archive:
+        merge_archive(stats_obj)
+    stats_obj = get_stats_obj(stats_obj['projects'])
     try:
         if create_archive:
-            with open('./archive.json', 'w') as f:
-                f.write(stats_json)
+            write_file_atomic(JS_ARCHIVE_FILE, json.dumps(stats_obj))
+        elif args.shard is not None:
+            stats_obj['shard'] = list(args.shard)
+            write_file_atomic(JS_OUTPUT_JSON_FILE, json.dumps(stats_obj))
         else:
-            with open(JS_OUTPUT_JSON_FILE, 'w') as f:
-                f.write(stats_json)
+            write_output(stats_obj, shard_writer)
     except OSError as e:
         log(e)
         sys.exit(e.errno)
+    finally:
+        JS_metrics.write()
 
 
 if __name__ == '__main__':
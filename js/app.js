@@ -1,6 +1,8 @@
 // DataLoader ----------------------------------------------------------------------------
 const DataLoader = function(project_ids, dataset_ids) {
   this.onLoadListeners = [];
+  this.onIndexListeners = [];
+  this.onProjectLoadListeners = [];
   this.rawData = null;
   this.projectIds = project_ids;
   this.datasetIds = dataset_ids;
@@ -26,33 +28,111 @@ const DataLoader = function(project_ids, dataset_ids) {
     return this.datasetIds.includes(''+d.id);
   }.bind(this);
 
-  this.filterByDatasetIds = function() {
+  this.filterProjectByDatasetIds = function(project) {
     if (this.datasetIds.length > 0) {
-      for (var p = 0; p < this.rawData.projects.length; ++p) {
-        for (var d = 0; d < this.rawData.projects[p].datasets.length; ++d) {
-          this.rawData.projects[p].datasets[d].id = d;
+      for (var d = 0; d < project.datasets.length; ++d) {
+        project.datasets[d].id = d;
+      }
+      project.datasets = project.datasets.filter(this.datasetsIncluded);
+    }
+  }
+
+  this.undelta = function(series) {
+    for (var i = 1; i < series.length; ++i) {
+      series[i] += series[i - 1];
+    }
+    return series;
+  }
+
+  // compact output: rebuild the dates, point links and absolute series left out of data.json
+  this.expandProject = function(project) {
+    for (var d = 0; d < project.datasets.length; ++d) {
+      var ds = project.datasets[d];
+      if (!ds.compact) {
+        continue;
+      }
+      if (ds.dates_start !== undefined) {
+        ds.dates = [];
+        var start = new Date(ds.dates_start + 'T00:00:00Z').getTime();
+        for (var i = 0; i < ds.dates_count; ++i) {
+          ds.dates.push(new Date(start + i * ds.dates_step * 86400000).toISOString().slice(0, 10));
+        }
+      }
+      ds.total_estimates = this.undelta(ds.total_estimates);
+      ds.burned_estimates = this.undelta(ds.burned_estimates);
+      ds.remaining_estimates = ds.total_estimates.map(function(total, i) {
+        return total - ds.burned_estimates[i];
+      });
+      if (ds.url_templates) {
+        ds.urls = {};
+        for (var name in ds.url_templates) {
+          ds.urls[name] = ds.dates.map(function(date) {
+            return ds.url_templates[name].replace('{date}', date);
+          });
         }
-        this.rawData.projects[p].datasets = this.rawData.projects[p].datasets.filter(this.datasetsIncluded);
       }
     }
   }
 
+  this.notify = function(listeners, arg) {
+    for(var i in listeners) {
+      listeners[i](arg);
+    }
+  }
+
   this.load = function(url, onComplete) {
     var self = this;
     $.getJSON(url, function(data) {
       self.rawData = data;
       self.filterByIds();
-      self.filterByDatasetIds();
-      for(var i in self.onLoadListeners) {
-        self.onLoadListeners[i]();
+      self.notify(self.onIndexListeners);
+      if (data.sharded) {
+        self.loadShards(url);
+      } else {
+        for (var p = 0; p < self.rawData.projects.length; ++p) {
+          self.expandProject(self.rawData.projects[p]);
+          self.filterProjectByDatasetIds(self.rawData.projects[p]);
+          self.notify(self.onProjectLoadListeners, p);
+        }
+        self.notify(self.onLoadListeners);
       }
     });
   };
 
+  // sharded output: the index only lists projects, each one is fetched on its own and rendered as soon as it arrives
+  this.loadShards = function(url) {
+    var self = this;
+    var baseUrl = url.substring(0, url.lastIndexOf('/') + 1);
+    var pending = this.rawData.projects.length;
+    if (pending === 0) {
+      self.notify(self.onLoadListeners);
+    }
+    $.each(this.rawData.projects, function(p, entry) {
+      $.getJSON(baseUrl + entry.url, function(project) {
+        self.expandProject(project);
+        self.filterProjectByDatasetIds(project);
+        self.rawData.projects[p] = project;
+        self.notify(self.onProjectLoadListeners, p);
+      }).always(function() {
+        if (--pending === 0) {
+          self.notify(self.onLoadListeners);
+        }
+      });
+    });
+  };
+
   this.onLoad = function(callback) {
     this.onLoadListeners.push(callback);
   };
 
+  this.onIndex = function(callback) {
+    this.onIndexListeners.push(callback);
+  };
+
+  this.onProjectLoad = function(callback) {
+    this.onProjectLoadListeners.push(callback);
+  };
+
   this.getChartCount = function() {
     return this.rawData ? this.rawData.projects.length : 0;
   };
@@ -123,6 +203,9 @@ const ProjectRenderer = function(data, datasetCount) {
     } else {
       $container.html(this.data.title);
     }
+    if (this.data.stale) {
+      $container.append(' <small class="text-muted">(data from ' + this.data.fetched_at + ')</small>');
+    }
   }
 
   this.renderScopeStats = function($container, id) {
@@ -369,12 +452,17 @@ function getShowOnlyDatasets() {
 }
 // Entrypoint ------------------------------------------------------------------
 var loader = new DataLoader(getProjectIds(), getShowOnlyDatasets());
-loader.onLoad(function() {
+loader.onIndex(function() {
   var chartCount = loader.getChartCount();
   for(var i = 0; i < chartCount; ++i) {
-    var renderer = new ProjectRenderer(loader.getChartData(i), loader.getDatasetCount(i));
-    renderer.render($('#dashboard'));
+    $('#dashboard').append('<div class="project-container' + i + '"></div>');
   }
+});
+loader.onProjectLoad(function(i) {
+  var renderer = new ProjectRenderer(loader.getChartData(i), loader.getDatasetCount(i));
+  renderer.render($('#dashboard .project-container' + i));
+});
+loader.onLoad(function() {
   $('#footer').append(
     '<div class="container text-center">' +
       '<p class="text-muted credit small" style="margin-top:30px">' + loader.getGeneratedAt() + '</p>' +